@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+"""A synthetic catalog, and a stub of `DB` which returns its rows for the catalog queries, so `PGUML` can be
+measured at any scale without a database.
+
+The rows have exactly the shapes of the queries in constants.py, keep them in sync when a query is changed.
+"""
+
+import random
+
+COLUMN_TYPES = [
+    ('int4', None),
+    ('int8', None),
+    ('text', None),
+    ('varchar(100)', None),
+    ('timestamptz', 'now()'),
+    ('numeric', '0'),
+    ('bool', 'false'),
+]
+
+FIRST_OID = 16384
+
+
+class SyntheticCatalog():
+    """`tables` relations spread over `schemas` schemas, each one has `columns` columns and `fk_density` fks on
+    average, one of `partitioned_every` tables is a partitioned table with `partitions` partitions, and one of
+    `checks_every` tables has a check constraint. The partitions are counted in `tables`."""
+
+    def __init__(self, tables=1000, schemas=10, columns=10, fk_density=1.0, partitioned_every=50, partitions=8,
+                 checks_every=5, seed=0):
+        self.random = random.Random(seed)
+        self.columns = max(2, columns)
+        self.rows = {
+            'tables': [],
+            'columns': [],
+            'pk_uk': [],
+            'fk': [],
+            'inherits': [],
+            'checks': [],
+            'collapsed': [],
+            'heat': [],
+            'fk_columns': [],
+            'indexes': [],
+        }
+        self.oids = []
+
+        oid = FIRST_OID
+        schema_names = ['public'] + ['schema_{}'.format(i) for i in range(1, schemas)]
+        while len(self.oids) < tables:
+            schema = schema_names[len(self.oids) % len(schema_names)]
+            tablename = 'table_{}'.format(len(self.oids))
+            partitioned = partitioned_every and len(self.oids) % partitioned_every == 1
+            self._add_table(oid, schema, tablename, 'partitioned table' if partitioned else 'table',
+                            len(self.oids) % checks_every == 0 if checks_every else False)
+            parent = oid
+            oid += 1
+            if not partitioned:
+                continue
+            for i in range(min(partitions, tables - len(self.oids))):
+                self._add_table(oid, schema, '{}_p{}'.format(tablename, i), 'table', False)
+                self.rows['inherits'].append((parent, schema, tablename, oid, schema, '{}_p{}'.format(tablename, i)))
+                oid += 1
+
+        for from_oid in self.oids:
+            for _ in range(self._poisson(fk_density)):
+                to_oid = self.random.choice(self.oids)
+                column = 'col_{}'.format(self.random.randrange(1, self.columns))
+                self.rows['fk'].append((from_oid, 'fk_{}_{}'.format(from_oid, to_oid), column, 'id', to_oid))
+                self.rows['fk_columns'].append((from_oid, 'fk_{}_{}'.format(from_oid, to_oid), [column], to_oid))
+                # half of the fks have an index
+                if self.random.random() < 0.5:
+                    self.rows['indexes'].append((from_oid, 'idx_{}_{}'.format(from_oid, column), [column], 'btree',
+                                                 False, False, None, None, 8192))
+
+        # the same order as the queries
+        self.rows['tables'].sort(key=lambda row: (row[1], row[2]))
+
+    def _poisson(self, mean):
+        """a small random number of fks, `mean` on average"""
+        count = int(mean)
+        if self.random.random() < mean - count:
+            count += 1
+        return count
+
+    def _add_table(self, oid, schema, tablename, reltype, check):
+        self.oids.append(oid)
+        self.rows['tables'].append((oid, schema, tablename, 'description of {}'.format(tablename), reltype))
+        self.rows['columns'].append((oid, schema, tablename, 'id', 'primary key', 'int8', False, None))
+        for i in range(1, self.columns):
+            coltype, coldefault = COLUMN_TYPES[i % len(COLUMN_TYPES)]
+            self.rows['columns'].append((oid, schema, tablename, 'col_{}'.format(i), None, coltype, i % 3 != 0,
+                                         coldefault))
+        self.rows['pk_uk'].append((oid, '{}_pkey'.format(tablename), ['id'], 'PK'))
+        self.rows['indexes'].append((oid, '{}_pkey'.format(tablename), ['id'], 'btree', True, True, None, None, 8192))
+        if len(self.oids) % 10 == 0:
+            self.rows['pk_uk'].append((oid, '{}_uk'.format(tablename), ['col_1', 'col_2'], 'UK'))
+        rows = int(self.random.paretovariate(1.2) * 1000)
+        self.rows['heat'].append((oid, rows, rows // 50 + 1, (rows // 50 + 1) * 8192, self.random.randrange(100),
+                                  self.random.randrange(10000), rows, rows // 10, rows // 100))
+        if check:
+            self.rows['checks'].append((oid, '{}_check'.format(tablename), '(col_1 > 0)'))
+
+    def total_rows(self):
+        return sum(len(rows) for rows in self.rows.values())
+
+
+class StubDB():
+    """answers the catalog queries of a `PGUML` with the rows of a `SyntheticCatalog`, the queries are known by
+    their text, so this works whatever filters are compiled into them"""
+
+    def __init__(self, catalog, uml):
+        self.catalog = catalog
+        self.queries = dict((sql, name) for name, sql in uml.queries.items())
+        self.queries[uml.signatures_sql] = 'signatures'
+        self.executed = []
+
+    def execute_sql(self, sql, params=None):
+        name = self.queries.get(sql)
+        if name is None:
+            raise ValueError('The stub can not answer this query: {}'.format(sql))
+        self.executed.append(name)
+        if name == 'signatures':
+            return [(oid, str(oid)) for oid in self.catalog.oids]
+        return list(self.catalog.rows[name])
+
+    def export_snapshot(self):
+        raise NotImplementedError('The stub has only one connection')
+
+    def end_transaction(self):
+        pass
+
+    def close(self):
+        pass
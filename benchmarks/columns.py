@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Compare the column queries, pg_attribute based catalog query vs information_schema.columns.
+
+Run it against the database you want to document, e.g.
+
+    $ ./benchmarks/columns.py --host 10.10.8.1 --rounds 5
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uml import DB, COLUMNS_QUERIES, PGUML, get_parser  # noqa: E402
+
+
+def columns_query(db, name):
+    """the columns query `name` as `PGUML` runs it, with the relations and the server version filled in"""
+    uml = PGUML(get_parser().parse_args(['--columns-from', name]))
+    uml.db = db
+    uml._use_server_version()
+    return uml.queries['columns'], uml.query_params
+
+
+def run(db, sql, params, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.time()
+        rows = db.execute_sql(sql, params)
+        timings.append(time.time() - start)
+    return rows, timings
+
+
+def columns_by_table(rows):
+    """oid -> column list, which is exactly what `PGUML._process_columns` uses"""
+    tables = {}
+    for row in rows:
+        oid, _, _, colname, coldesc, coltype, is_nullable, coldefault = row
+        tables.setdefault(oid, []).append((colname, coldesc, coltype, is_nullable, coldefault))
+    return tables
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--host', help='Database hostname', type=str, default='127.0.0.1')
+    parser.add_argument('--port', help='Database port', type=str, default='5432')
+    parser.add_argument('--dbname', help='Database name', type=str, default='postgres')
+    parser.add_argument('--user', help='Database user', type=str, default='user')
+    parser.add_argument('--password', help='Database passowrd', type=str, default='')
+    parser.add_argument('--rounds', help='Run every query this many times', type=int, default=3)
+    opts = parser.parse_args()
+
+    db = DB(dbname=opts.dbname, port=opts.port, host=opts.host, user=opts.user, password=opts.password)
+    results = {}
+    for name in sorted(COLUMNS_QUERIES):
+        sql, params = columns_query(db, name)
+        rows, timings = run(db, sql, params, opts.rounds)
+        results[name] = columns_by_table(rows)
+        print('{:<20} rows: {:>8}  min: {:>8.3f}s  avg: {:>8.3f}s'.format(
+            name, len(rows), min(timings), sum(timings) / len(timings)))
+    db.close()
+
+    catalog, information_schema = results['catalog'], results['information_schema']
+    # information_schema.columns skip materialized views and the columns you have no privilege on
+    diffs = [oid for oid in information_schema if catalog.get(oid) != information_schema[oid]]
+    print('tables: {} vs {}, different columns: {}'.format(len(catalog), len(information_schema), len(diffs)))
+    for oid in diffs:
+        print('  oid {}:\n    catalog:            {}\n    information_schema: {}'.format(
+            oid, catalog.get(oid), information_schema[oid]))
+
+
+if __name__ == '__main__':
+    main()
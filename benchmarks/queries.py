@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Check the catalog queries without a database: the queries of every set of options are filled in for each server
+version, none of them may keep a placeholder, and each one must have the variant of `VERSIONED_SQL` for the
+version. The "%(name)s" params must all be turned into the "$n" params of a prepared statement by `to_prepared`.
+Run it after a query is changed, e.g.
+
+    $ ./benchmarks/queries.py
+"""
+
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from uml import PGUML, get_parser, to_prepared, versioned_sql  # noqa: E402
+
+# server_version_num of the versions the variants are picked for
+SERVER_VERSIONS = (90600, 100000, 110000, 120000, 160000)
+
+# the options which add queries or change their conditions, every query is made by one of them
+OPTIONS = (
+    [],
+    ['--columns-from', 'information_schema'],
+    ['--collapse-partitions', '--heat', 'size', '--check-indexes'],
+    ['--schema', 'sales_*', '--exclude-schema', 'tmp', '--table', 'orders', '--exclude-table', '~_old$',
+     '--focus', 'orders', '--collapse-threshold', '100', '--top', '10'],
+    ['--extract', 'json', '--collapse-partitions', '--heat', 'workload', '--check-indexes'],
+)
+
+PLACEHOLDER_PATTERN = re.compile(r'\{\w+\}')
+
+# sql, the prepared sql and its params
+PREPARED = (
+    ('select %(a)s, %(b)s, %(a)s', 'select $1, $2, $1', ['a', 'b']),
+    ("select 1 where x like 'a%%' and y = %(y)s", "select 1 where x like 'a%' and y = $1", ['y']),
+    ("select '%%(a)s', %(a)s", "select '%(a)s', $1", ['a']),
+    ('select 5 % 2', 'select 5 % 2', []),
+    ('select 1', 'select 1', []),
+)
+
+
+class VersionDB():
+    """only tells the server version, which is all `PGUML._use_server_version` needs"""
+
+    def __init__(self, server_version):
+        self.server_version = server_version
+
+
+def query_errors(args, server_version):
+    """the errors of the queries made with `args` for a server version"""
+    uml = PGUML(get_parser().parse_args(args))
+    uml.db = VersionDB(server_version)
+    templates = dict(uml.queries)
+    uml._use_server_version()
+    queries = list(uml.queries.items()) + [('signatures', uml.signatures_sql)]
+    if uml.extract == 'json':
+        queries.append(('extract', uml._extract_sql()))
+
+    errors = []
+    for name, sql in queries:
+        placeholders = sorted(set(PLACEHOLDER_PATTERN.findall(sql)))
+        if placeholders:
+            errors.append('{}: {} left'.format(name, ', '.join(placeholders)))
+        prepared_sql, params = to_prepared(sql)
+        if '%(' in prepared_sql:
+            errors.append('{}: a param is not turned into $n'.format(name))
+        unknown = set(params) - set(uml.query_params)
+        if unknown:
+            errors.append('{}: unknown params {}'.format(name, ', '.join(sorted(unknown))))
+
+    for part, sql in versioned_sql(server_version).items():
+        for name, template in templates.items():
+            if '{' + part + '}' in template and sql not in uml.queries[name]:
+                errors.append('{}: {} is not "{}"'.format(name, part, sql))
+    return errors
+
+
+def prepared_errors():
+    errors = []
+    for sql, prepared_sql, params in PREPARED:
+        result = to_prepared(sql)
+        if result != (prepared_sql, params):
+            errors.append('to_prepared({!r}) is {!r}, not {!r}'.format(sql, result, (prepared_sql, params)))
+    return errors
+
+
+def main():
+    failed = False
+    for server_version in SERVER_VERSIONS:
+        for args in OPTIONS:
+            errors = query_errors(args, server_version)
+            failed = failed or bool(errors)
+            print('{:>6}  {:<6}  {}'.format(server_version, 'FAILED' if errors else 'ok',
+                                            ' '.join(args) or '(default options)'))
+            for error in errors:
+                print('    ' + error)
+
+    errors = prepared_errors()
+    failed = failed or bool(errors)
+    print('{:>6}  {:<6}  {}'.format('', 'FAILED' if errors else 'ok', 'to_prepared'))
+    for error in errors:
+        print('    ' + error)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
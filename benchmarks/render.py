@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Measure how `PGUML` scales, on synthetic catalogs served by a stub database.
+
+Every `_process_*` phase, building the view and rendering dot and html are timed at each scale, the peak memory of
+each phase is measured in a separate round with tracemalloc, and so is the memory the collected model keeps. Save
+the results and compare them with the next version, e.g.
+
+    $ ./benchmarks/render.py --scales 1000,10000 --output before.json
+    $ ./benchmarks/render.py --scales 1000,10000 --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from uml import PGUML, get_parser  # noqa: E402
+from catalog import StubDB, SyntheticCatalog  # noqa: E402
+
+RESULT_VERSION = 1
+
+
+class CountingWriter():
+    """consume the rendered chunks without keeping them"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, chunk):
+        self.size += len(chunk.encode('utf-8'))
+
+    def flush(self):
+        pass
+
+
+def fresh(value):
+    """a new copy of a value of a row, as the driver makes for every row, so the interned names are measured"""
+    if isinstance(value, str):
+        return value.encode('utf-8').decode('utf-8')
+    if isinstance(value, list):
+        return [fresh(item) for item in value]
+    return value
+
+
+def measure_model(catalog, uml_args):
+    """the memory kept by the model after all the rows are processed, the rows are made and dropped while traced"""
+    uml = PGUML(get_parser().parse_args(uml_args))
+    uml.db = StubDB(catalog, uml)
+    tracemalloc.start()
+    for name, sql in uml.queries.items():
+        rows = [tuple(fresh(value) for value in row) for row in uml.db.execute_sql(sql, uml.query_params)]
+        uml._process(name, rows)
+        del rows
+    model_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return model_bytes
+
+
+def run_phases(catalog, uml_args, measure_memory):
+    """run the phases of `PGUML.go` one by one, return phase -> seconds or peak bytes, and the output sizes"""
+    uml = PGUML(get_parser().parse_args(uml_args))
+    uml.db = StubDB(catalog, uml)
+    results, output_bytes = {}, {}
+
+    def measure(phase, func):
+        if measure_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+        if measure_memory:
+            results[phase] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            results[phase] = seconds
+
+    for name, sql in uml.queries.items():
+        rows = uml.db.execute_sql(sql, uml.query_params)
+        measure('process_{}'.format(name), lambda: uml._process(name, rows))
+
+    def build_view():
+        uml.view = uml._build_view()
+
+    measure('build_view', build_view)
+    for name in ('dot', 'html'):
+        writer = CountingWriter()
+        measure('render_{}'.format(name), lambda: uml._write_chunks(uml._render(name), writer))
+        output_bytes[name] = writer.size
+    return results, output_bytes
+
+
+def run_scale(tables, opts):
+    catalog = SyntheticCatalog(tables=tables, schemas=opts.schemas, columns=opts.columns, fk_density=opts.fk_density,
+                               partitioned_every=opts.partitioned_every, partitions=opts.partitions,
+                               checks_every=opts.checks_every)
+    uml_args = ['--show-constraint'] + opts.uml_args
+
+    rounds = [run_phases(catalog, uml_args, False)[0] for _ in range(opts.rounds)]
+    memory, output_bytes = run_phases(catalog, uml_args, True)
+    phases = {}
+    for phase in rounds[0]:
+        timings = [timing[phase] for timing in rounds]
+        phases[phase] = {
+            'min_seconds': min(timings),
+            'avg_seconds': sum(timings) / len(timings),
+            'peak_bytes': memory[phase],
+        }
+    return {
+        'tables': tables,
+        'rows': catalog.total_rows(),
+        'output_bytes': output_bytes,
+        'model_bytes': measure_model(catalog, uml_args),
+        'phases': phases,
+    }
+
+
+def compare(results, baseline, threshold):
+    """print the changes against the baseline, return the phases slower than `threshold` times"""
+    regressions = []
+    for scale, result in sorted(results['scales'].items(), key=lambda item: int(item[0])):
+        base = baseline['scales'].get(scale)
+        if base is None:
+            continue
+        if base.get('model_bytes'):
+            print('{:>8} {:<20} memory: {:>6.2f}x'.format(scale, 'model', result['model_bytes'] / base['model_bytes']))
+        for phase, stats in sorted(result['phases'].items()):
+            base_stats = base['phases'].get(phase)
+            if base_stats is None or not base_stats['min_seconds']:
+                continue
+            ratio = stats['min_seconds'] / base_stats['min_seconds']
+            memory_ratio = stats['peak_bytes'] / float(base_stats['peak_bytes'] or 1)
+            slower = ratio > threshold
+            print('{:>8} {:<20} time: {:>6.2f}x  memory: {:>6.2f}x{}'.format(
+                scale, phase, ratio, memory_ratio, '  REGRESSION' if slower else ''))
+            if slower:
+                regressions.append((scale, phase))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--scales', help='Number of tables of each run, comma separated', type=str,
+                        default='1000,10000,100000')
+    parser.add_argument('--schemas', help='Number of schemas', type=int, default=10)
+    parser.add_argument('--columns', help='Number of columns of each table', type=int, default=10)
+    parser.add_argument('--fk-density', help='Number of fks of each table on average', type=float, default=1.0)
+    parser.add_argument('--partitioned-every', help='One of this many tables is partitioned, 0 for none', type=int,
+                        default=50)
+    parser.add_argument('--partitions', help='Number of partitions of a partitioned table', type=int, default=8)
+    parser.add_argument('--checks-every', help='One of this many tables has a check constraint, 0 for none',
+                        type=int, default=5)
+    parser.add_argument('--rounds', help='Time every phase this many times', type=int, default=3)
+    parser.add_argument('--uml-args', help='More uml.py options for the runs, e.g. "--only-key-columns"', type=str,
+                        default='')
+    parser.add_argument('--output', help='Write the results to this json file', type=str)
+    parser.add_argument('--compare', help='Compare with the results in this json file', type=str)
+    parser.add_argument('--threshold', help='Compare: a phase this many times slower is a regression', type=float,
+                        default=1.25)
+    opts = parser.parse_args()
+    opts.uml_args = opts.uml_args.split()
+
+    results = {
+        'version': RESULT_VERSION,
+        'python': platform.python_version(),
+        'options': vars(opts),
+        'scales': {},
+    }
+    for tables in [int(scale) for scale in opts.scales.split(',')]:
+        result = run_scale(tables, opts)
+        results['scales'][str(tables)] = result
+        for phase, stats in sorted(result['phases'].items()):
+            print('{:>8} {:<20} min: {:>8.3f}s  avg: {:>8.3f}s  peak: {:>8.1f}MB'.format(
+                tables, phase, stats['min_seconds'], stats['avg_seconds'], stats['peak_bytes'] / 1048576.0))
+        print('{:>8} {:<20} {:>8.1f}MB'.format(tables, 'model', result['model_bytes'] / 1048576.0))
+
+    if opts.output:
+        with open(opts.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if opts.compare:
+        with open(opts.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('version') != RESULT_VERSION:
+            sys.exit('{} is made by another version of this benchmark'.format(opts.compare))
+        if compare(results, baseline, opts.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,169 @@
+# the relations to document, `conditions` are the schema and table filters given on the command line,
+# the queries below use it as `{relations}` to filter on the server side
+SQL_RELATIONS = '''
+    select
+        pg_class.oid
+    from
+        pg_catalog.pg_class
+    join
+        pg_catalog.pg_namespace on (relnamespace = pg_namespace.oid)
+    where
+        relkind in ('r', 'v', 'm', 'f', 'p')
+        and nspname !~ 'pg_catalog|pg_toast|pg_temp_[0-9]+|information_schema'
+        {conditions}
+'''
+
+# a signature for each relation, which changes with any DDL on the relation, its columns, comments, constraints,
+# indexes and parents, it's cheap because all the lookups are index scans on the oid
+SQL_SIGNATURES = '''
+    select
+        pg_class.oid,
+        pg_catalog.md5(concat_ws('/',
+            pg_class.xmin::text,
+            pg_namespace.xmin::text,
+            (select string_agg(a.attnum || ':' || a.xmin::text, ',' order by a.attnum)
+                from pg_catalog.pg_attribute a where a.attrelid = pg_class.oid and a.attnum > 0),
+            (select string_agg(ad.adnum || ':' || ad.xmin::text, ',' order by ad.adnum)
+                from pg_catalog.pg_attrdef ad where ad.adrelid = pg_class.oid),
+            (select string_agg(con.oid || ':' || con.xmin::text, ',' order by con.oid)
+                from pg_catalog.pg_constraint con where con.conrelid = pg_class.oid),
+            (select string_agg(d.objsubid || ':' || d.xmin::text, ',' order by d.objsubid)
+                from pg_catalog.pg_description d
+                where d.objoid = pg_class.oid and d.classoid = 'pg_catalog.pg_class'::regclass),
+            (select string_agg(i.inhparent || ':' || i.xmin::text, ',' order by i.inhparent)
+                from pg_catalog.pg_inherits i where i.inhrelid = pg_class.oid),
+            (select string_agg(i.inhrelid::text, ',' order by i.inhrelid)
+                from pg_catalog.pg_inherits i where i.inhparent = pg_class.oid),
+            (select string_agg(x.indexrelid || ':' || x.xmin::text, ',' order by x.indexrelid)
+                from pg_catalog.pg_index x where x.indrelid = pg_class.oid)
+        )) as signature
+    from
+        pg_catalog.pg_class
+    join
+        pg_catalog.pg_namespace on (relnamespace = pg_namespace.oid)
+    where
+        relkind in ('r', 'v', 'm', 'f', 'p')
+        and nspname !~ 'pg_catalog|pg_toast|pg_temp_[0-9]+|information_schema'
+        {conditions}
+'''
+
+# the children which are shown as one summary node of their parent: the partitions of a partitioned table, and
+# the children of a parent which has too many of them, but not the ones have their own columns
+SQL_COLLAPSED_CHILDREN = '''
+    select
+        i.inhrelid
+    from
+        pg_catalog.pg_inherits i
+    join
+        pg_catalog.pg_class parent on (parent.oid = i.inhparent)
+    where
+        (
+            (parent.relkind = 'p' and %(collapse_partitions)s)
+            or i.inhparent in (
+                select inhparent from pg_catalog.pg_inherits
+                group by inhparent having count(*) >= %(collapse_threshold)s
+            )
+        )
+        and not exists (
+            select 1 from pg_catalog.pg_attribute a
+            where a.attrelid = i.inhrelid and a.attnum > 0 and not a.attisdropped and a.attinhcount = 0
+        )
+'''
+
+# the parents of the collapsed children, with how many children are collapsed and the partition key
+SQL_COLLAPSED = '''
+    select
+        i.inhparent as oid,
+        count(*) as children,
+        {partkey} as partkey
+    from
+        pg_catalog.pg_inherits i
+    join
+        pg_catalog.pg_class parent on (parent.oid = i.inhparent)
+    where
+        i.inhrelid in ({collapsed_children})
+        and i.inhparent in ({relations})
+    group by i.inhparent, parent.oid, parent.relkind
+'''
+
+# the size and the workload of the relations, for the heat overlay, in one query. reltuples is -1 for a table
+# never analyzed. the counters are since the last stats reset, and null for a view
+SQL_HEAT = '''
+    select
+        pg_class.oid,
+        greatest(pg_class.reltuples, 0)::bigint as reltuples,
+        pg_class.relpages::bigint as relpages,
+        pg_catalog.pg_total_relation_size(pg_class.oid) as total_bytes,
+        coalesce(s.seq_scan, 0) as seq_scan,
+        coalesce(s.idx_scan, 0) as idx_scan,
+        coalesce(s.n_tup_ins, 0) as n_tup_ins,
+        coalesce(s.n_tup_upd, 0) as n_tup_upd,
+        coalesce(s.n_tup_del, 0) as n_tup_del
+    from
+        pg_catalog.pg_class
+    left join
+        pg_catalog.pg_stat_user_tables s on (s.relid = pg_class.oid)
+    where
+        pg_class.oid in ({relations})
+'''
+
+# the rows of one catalog query grouped by the relation, a json array for each one. the order by of the query is
+# not kept by a subquery, so the rows of a relation are ordered by {order}, see `EXTRACT_ORDER`
+SQL_EXTRACT_PART = '''
+    q_{name} as (
+        select s.{oid_column} as oid, json_agg(pg_catalog.to_json(s){order}) as rows
+        from ({sql}) as s
+        group by s.{oid_column}
+    )'''
+
+# all the catalog queries in one, a json document with the rows of every query for each table
+SQL_EXTRACT = '''
+    with {parts}
+    select
+        q_tables.oid,
+        json_build_object({documents}) as document
+    from
+        q_tables
+    {joins}
+'''
+
+# the relations within `focus_depth` fk or inherit hops of the focus tables, "out" follows the fks to the tables
+# they reference and the children to their parents, "in" goes the other way
+SQL_FOCUS = '''
+    with recursive edges(src, dst) as (
+        select conrelid, confrelid from pg_catalog.pg_constraint
+        where contype = 'f' and %(focus_direction)s in ('out', 'both')
+        union all
+        select confrelid, conrelid from pg_catalog.pg_constraint
+        where contype = 'f' and %(focus_direction)s in ('in', 'both')
+        union all
+        select inhrelid, inhparent from pg_catalog.pg_inherits
+        where %(focus_direction)s in ('out', 'both')
+        union all
+        select inhparent, inhrelid from pg_catalog.pg_inherits
+        where %(focus_direction)s in ('in', 'both')
+    ), focus(oid, depth) as (
+        select
+            pg_class.oid, 0
+        from
+            pg_catalog.pg_class
+        join
+            pg_catalog.pg_namespace on (relnamespace = pg_namespace.oid)
+        where
+            nspname || '.' || relname ~ any(%(focus)s::text[])
+        union
+        select
+            edges.dst, focus.depth + 1
+        from
+            focus
+        join
+            edges on (edges.src = focus.oid)
+        where
+            focus.depth < %(focus_depth)s
+    )
+    select oid from focus
+'''
+
 SQL_TABLES = '''
     select
         pg_class.oid,
@@ -11,6 +177,8 @@ SQL_TABLES = '''
              'view'
            when relkind = 'm' then
              'materialized view'
+           when relkind = 'p' then
+             'partitioned table'
            else
              'foreign table'
            end as reltype
@@ -19,13 +187,47 @@ SQL_TABLES = '''
     join
         pg_catalog.pg_namespace on (relnamespace = pg_namespace.oid)
     where
-        relkind in ('r', 'v', 'm', 'f')
+        relkind in ('r', 'v', 'm', 'f', 'p')
         and nspname !~ 'pg_catalog|pg_toast|pg_temp_[0-9]+|information_schema'
+        {conditions}
     order by nspname, relname
 '''
-# SQL_TABLES += ' and pg_class.oid in (34328, 19930423, 35358, 35601, 24474327, 37183, 34864, 34423, 34987)'
 
 SQL_COLUMNS = '''
+    select
+        a.attrelid as oid,
+        n.nspname as schema,
+        c.relname as table_name,
+        a.attname as column_name,
+        d.description as desc,
+        coalesce(bt.typname, t.typname) || coalesce('(' ||
+            case
+              when coalesce(bt.oid, t.oid) in ('pg_catalog.bpchar'::regtype, 'pg_catalog.varchar'::regtype) then
+                nullif(case when t.typtype = 'd' then t.typtypmod else a.atttypmod end, -1) - 4
+              when coalesce(bt.oid, t.oid) in ('pg_catalog.bit'::regtype, 'pg_catalog.varbit'::regtype) then
+                nullif(case when t.typtype = 'd' then t.typtypmod else a.atttypmod end, -1)
+              end || ')', '') as column_type,
+        not (a.attnotnull or (t.typtype = 'd' and t.typnotnull)) as is_nullable,
+        pg_catalog.pg_get_expr(ad.adbin, ad.adrelid) as column_default
+    from
+        pg_catalog.pg_attribute a
+    join pg_catalog.pg_class c on (c.oid = a.attrelid)
+    join pg_catalog.pg_namespace n on (n.oid = c.relnamespace)
+    join pg_catalog.pg_type t on (t.oid = a.atttypid)
+    left join pg_catalog.pg_type bt on (t.typtype = 'd' and bt.oid = t.typbasetype)
+    left join pg_catalog.pg_attrdef ad on (ad.adrelid = a.attrelid and ad.adnum = a.attnum)
+    left join pg_catalog.pg_description d
+        on (d.objoid = a.attrelid and d.classoid = 'pg_catalog.pg_class'::regclass and d.objsubid = a.attnum)
+    where
+        a.attrelid in ({relations})
+        and a.attnum > 0
+        and not a.attisdropped
+    order by
+        a.attrelid, a.attnum
+'''
+
+# the old way, join information_schema.columns on table name, which is much slower on a big catalog
+SQL_COLUMNS_INFORMATION_SCHEMA = '''
     select
         a.oid,
         b.table_schema as schema,
@@ -45,15 +247,23 @@ SQL_COLUMNS = '''
         pg_catalog.pg_namespace c
     on
         a.relnamespace=c.oid and b.table_schema=c.nspname
+    where
+        a.oid in ({relations})
     order by
         b.table_schema, b.table_name, b.ordinal_position
 '''
 
+# the columns of the pk/uk constraints, in the order of the constraint, resolved on the server side
 SQL_PK_UK = '''
     select
         c.conrelid as oid,
         conname AS constraint_name,
-        pg_catalog.pg_get_indexdef(d.objid) AS constraint_definition,
+        array(
+            select a.attname::text
+            from unnest(c.conkey) with ordinality as k(attnum, position)
+            join pg_catalog.pg_attribute a on (a.attrelid = c.conrelid and a.attnum = k.attnum)
+            order by k.position
+        ) AS constraint_columns,
         case
           when contype = 'p' then
             'PK'
@@ -62,14 +272,13 @@ SQL_PK_UK = '''
           end as constraint_type
     from
         pg_catalog.pg_constraint as c
-    join
-        pg_catalog.pg_depend as d
-    on
-        d.refobjid = c.oid
     where
         contype in ('p', 'u')
+        and c.conrelid in ({relations})
 '''
 
+# an fk which references a partitioned table is cloned for every partition on the same table, only the parent
+# constraint is kept. the clones on the partitions of a referencing table have their own conrelid, and are kept
 SQL_FK = '''
     select
         pct.conrelid as oid,
@@ -78,13 +287,69 @@ SQL_FK = '''
             end as constraint_name,
         pa.attname as constraint_key,
         paf.attname as constraint_fkey,
-        confrelid as ref_oid
+        pct.confrelid as ref_oid
     from
         pg_catalog.pg_constraint pct
     join pg_catalog.pg_class on (pg_class.oid = conrelid)
     join pg_catalog.pg_class as pc on (pc.oid = confrelid)
     join pg_catalog.pg_attribute as pa on (pa.attnum = pct.conkey[1] and pa.attrelid = conrelid)
     join pg_catalog.pg_attribute as paf on (paf.attnum = pct.confkey[1] and paf.attrelid = confrelid)
+    left join pg_catalog.pg_constraint as parent_c on (parent_c.oid = {fk_parent} and parent_c.conrelid = pct.conrelid)
+    where
+        pct.conrelid in ({relations})
+        and pct.confrelid in ({relations})
+        and parent_c.oid is null
+'''
+
+# all the columns of the fks, in the order of the constraint, only used by the index check. the clones of an fk
+# are skipped as `SQL_FK` does, but every partition of a referencing table needs its own index
+SQL_FK_COLUMNS = '''
+    select
+        pct.conrelid as oid,
+        pct.conname as constraint_name,
+        array(
+            select a.attname::text
+            from unnest(pct.conkey) with ordinality as k(attnum, position)
+            join pg_catalog.pg_attribute a on (a.attrelid = pct.conrelid and a.attnum = k.attnum)
+            order by k.position
+        ) as columns,
+        pct.confrelid as ref_oid
+    from
+        pg_catalog.pg_constraint pct
+    left join pg_catalog.pg_constraint as parent_c on (parent_c.oid = {fk_parent} and parent_c.conrelid = pct.conrelid)
+    where
+        pct.contype = 'f'
+        and pct.conrelid in ({relations})
+        and parent_c.oid is null
+'''
+
+# the indexes of the relations, the key columns in the index order, an expression is a null column.
+# the included columns are not keys, but `indnkeyatts` is only in PostgreSQL 11+, see `_use_server_version`
+SQL_INDEXES = '''
+    select
+        i.indrelid as oid,
+        ic.relname as index_name,
+        array(
+            select a.attname::text
+            from unnest(i.indkey::int2[]) with ordinality as k(attnum, position)
+            left join pg_catalog.pg_attribute a on (a.attrelid = i.indrelid and a.attnum = k.attnum)
+            where k.position <= {index_key_count}
+            order by k.position
+        ) as columns,
+        am.amname as method,
+        i.indisunique as is_unique,
+        i.indisprimary as is_primary,
+        pg_catalog.pg_get_expr(i.indexprs, i.indrelid) as expressions,
+        pg_catalog.pg_get_expr(i.indpred, i.indrelid) as predicate,
+        pg_catalog.pg_relation_size(i.indexrelid) as index_bytes
+    from
+        pg_catalog.pg_index i
+    join
+        pg_catalog.pg_class ic on (ic.oid = i.indexrelid)
+    join
+        pg_catalog.pg_am am on (am.oid = ic.relam)
+    where
+        i.indrelid in ({relations})
 '''
 
 SQL_INHERIT = '''
@@ -100,6 +365,9 @@ SQL_INHERIT = '''
     join pg_catalog.pg_namespace as chlnsp on (chlnsp.oid = chlcla.relnamespace)
     join pg_catalog.pg_class as parcla on (parcla.oid = inhparent)
     join pg_catalog.pg_namespace as parnsp on (parnsp.oid = parcla.relnamespace)
+    where
+        inhparent in ({relations})
+        and inhrelid in ({relations})
 '''
 
 SQL_CHECKS = '''
@@ -108,99 +376,83 @@ SQL_CHECKS = '''
         case when substring(pct.conname from 1 for 1) = '\$' then ''
             else pct.conname
             end as constraint_name,
-        consrc
+        pg_catalog.pg_get_expr(pct.conbin, pct.conrelid) as consrc
     from
         pg_catalog.pg_constraint pct,
         pg_catalog.pg_class
     where
         pg_class.oid = conrelid and contype = 'c'
+        and conrelid in ({relations})
 '''
 
 DOT_TEMPLATE = '''
+{%- set node_colors = {'added': 'palegreen', 'removed': 'lightpink', 'changed': 'orange'} -%}
+{%- set edge_colors = {'added': 'darkgreen', 'removed': 'gray', 'changed': 'orange'} -%}
 digraph G {
     node [shape=plaintext];
     edge [color=red];
     rankdir={{ rankdir }};
 
-    {% for oid, table in tables.items() -%}
-
-    {%- set show_table = True -%}
-    {%- if related_tables and oid not in related_tables -%}
-        {%- set show_table = False -%}
-    {%- endif -%}
-
-    {%- if show_table %}
-    {{ table.outputname | replace('.', '_') }} [
+    {% for table in tables %}
+    {{ table.node_id }} [
         label = <
             <TABLE BORDER="0" CELLBORDER="1" CELLSPACING="0">
-                <TR><TD BGCOLOR="yellow" ALIGN="center" COLSPAN="3">{{ table.outputname }}</TD></TR>
+              {%- if table.heat %}
+                <TR><TD BGCOLOR="{{ node_colors.get(table.status, table.heat.color) }}" ALIGN="center" COLSPAN="3">
+                    <FONT POINT-SIZE="{{ 14 + 2 * table.heat.level }}">{{ table.outputname }}</FONT><BR/>
+                    <FONT POINT-SIZE="10">{{ table.heat.label }}</FONT></TD></TR>
+              {%- else %}
+                <TR><TD BGCOLOR="{{ node_colors.get(table.status, 'yellow') }}" ALIGN="center" COLSPAN="3">
+                    {{- table.outputname }}</TD></TR>
+              {%- endif %}
                 <tr><td colspan="3" height="1"></td></tr>
-              {% for column in table.columns -%}
-
-                {%- set show_col = False -%}
-                {%- if oid in key_columns -%}
-                  {%- if column.colname in key_columns[oid] -%}
-                    {%- set show_col = True -%}
-                  {%- endif -%}
-                {%- else -%}
-                  {%- set show_col = True -%}
-                {%- endif -%}
-
-                {%- if show_col %}
+              {% for column in table.columns %}
+              {%- set bgcolor = ' BGCOLOR="%s"' % node_colors[column.status] if column.status else '' %}
                 <TR>
-                    <TD ALIGN="LEFT" PORT="{{ column.colname }}">
-                        {%- if column.colname == table.pk %}#{% elif not column.is_nullable %}*{% endif -%}
-                    </TD>
-                    <TD ALIGN="LEFT">{{ column.colname }}</TD>
-                    <TD ALIGN="LEFT">{{ column.coltype }}</TD>
+                    <TD ALIGN="LEFT" PORT="{{ column.colname }}"{{ bgcolor }}>{{ column.flag }}</TD>
+                    <TD ALIGN="LEFT"{{ bgcolor }}>{{ column.colname }}</TD>
+                    <TD ALIGN="LEFT"{{ bgcolor }}>{{ column.coltype }}</TD>
                 </TR>
-                {% endif -%}
-
-              {%- endfor %}
-              {%- if table.uk -%}
+              {% endfor %}
+              {%- if table.uk %}
                 <tr><td colspan="3" height="1"></td></tr>
-              {%- endif -%}
+              {%- endif %}
               {%- for uk in table.uk %}
                 <tr><td colspan="3">Unique({{ uk.columns }})</td></tr>
               {%- endfor %}
-
-              {%- if show_constraint -%}
-              {%- if table.checks -%}
+              {%- if table.checks %}
                 <tr><td colspan="3" height="1"></td></tr>
-              {%- endif -%}
+              {%- endif %}
               {%- for check in table.checks %}
-                <tr><td colspan="3">{{ check.cons_src | replace('>', '&gt;') | replace('<', '&lt;') }}</td></tr>
-              {%- endfor -%}
+                <tr><td colspan="3">{{ check.dot_src }}</td></tr>
+              {%- endfor %}
+              {%- if table.index_warnings %}
+                <tr><td colspan="3" height="1"></td></tr>
               {%- endif %}
+              {%- for warning in table.index_warnings %}
+                <tr><td colspan="3" BGCOLOR="lightsalmon">{{ warning }}</td></tr>
+              {%- endfor %}
             </TABLE>
         >
     ];
-    {% endif -%}
-    {%- endfor %}
+    {%- if table.collapsed %}
+    {{ table.node_id }}__children [label="{{ table.dot_collapsed }}" shape=box style=dashed];
+    {{ table.node_id }} -> {{ table.node_id }}__children[color="blue" style="dashed"];
+    {%- endif %}
+    {% endfor %}
 
-    {% for from_table_col, to_table_col in fks.items() -%}
-        {{ from_table_col }} -> {{ to_table_col }};
+    {% for from_port, to_port, status in fks -%}
+        {{ from_port }} -> {{ to_port }}{% if status %}[color="{{ edge_colors[status] }}"]{% endif %};
     {% endfor -%}
 
-    {% for ih in table_inherits -%}
-        {{ ih.par_outputname|replace('.', '_') }}
-           -> {{ ih.chl_outputname|replace('.', '_') }}[color="blue" style="dashed"];
+    {% for par_node, chl_node, status in inherits -%}
+        {{ par_node }}
+           -> {{ chl_node }}[color="{{ edge_colors.get(status, 'blue') }}" style="dashed"];
     {% endfor %}
 }
 '''
 
-HTML_TEMPLATE = '''
-<!DOCTYPE html>
-<html lang="zh-CN" class="">
-<head>
-<meta charset="utf-8">
-<meta http-equiv="X-UA-Compatible" content="IE=edge,chrome=1" />
-<meta name="renderer" content="webkit" />
-<title>{{ db_name }}</title>
-<script
-  src="https://code.jquery.com/jquery-3.1.1.min.js"
-  integrity="sha256-hVVnYaiADRTO2PzUGmuLJr8BLUSjGIZsDYGmIJLv2b8="
-  crossorigin="anonymous"></script>
+HTML_STYLE_TEMPLATE = '''
 <style type="text/css">
 table {
     border-collapse:collapse;
@@ -251,6 +503,35 @@ a:hover, a:focus, a:active {
     border-bottom:1px solid #329ECC;
 }
 
+tr.added td, .tbl.added h2 {
+    background-color:#DFF5DF !important;
+}
+
+tr.removed td, .tbl.removed h2 {
+    background-color:#F9DADA !important;
+    text-decoration:line-through;
+}
+
+tr.changed td, .tbl.changed h2 {
+    background-color:#FFE4B5 !important;
+}
+
+tr.index_warning td {
+    background-color:#FFD5C2 !important;
+}
+
+.heat th[data-sort] {
+    cursor:pointer;
+}
+
+.heat th.asc:after {
+    content:" \\25B2";
+}
+
+.heat th.desc:after {
+    content:" \\25BC";
+}
+
 .menu {
     position:fixed;
     float:right;
@@ -262,100 +543,110 @@ a:hover, a:focus, a:active {
     height: 100%;
 }
 </style>
-</head>
-<body>
-<div class='menu'>
-<div style='float:right'>
-    <span onClick='toggle_menu(this)'>close</span><span> | </span>
-    <span onClick='toggle_pin(this)'>unpin</span>
-</div>
-<div style='float:left' class='real_menu'>
-    {% set ns = namespace(prev_schema='') -%}
-    {%- for oid, table in tables.items() -%}
-        {%- set show_table = True -%}
-        {%- if related_tables and oid not in related_tables -%}
-            {%- set show_table = False -%}
-        {%- endif -%}
-
-        {% if show_table %}
-
-        {%- set curr_schema = table.schema -%}
-        {%- if curr_schema != ns.prev_schema -%}
-        {%- if ns.prev_schema != '' -%}</ul>{%- endif -%}
-    <span>{{ curr_schema }}</span>
-    <ul>
-        {%- endif -%}
-        <li><a href='#{{ table.outputname | replace('.', '_') }}'>{{ table.tablename }}</a></li>
-        {%- set ns.prev_schema = curr_schema -%}{{ prev_schema }}
-        {%- endif -%}
-    {% endfor %}
-    {%- if ns.prev_schema != '' -%}</ul>{%- endif -%}
-</div>
-</div>
-
-    {% for oid, table in tables.items() -%}
-
-    {%- set show_table = True -%}
-    {%- if related_tables and oid not in related_tables -%}
-        {%- set show_table = False -%}
-    {%- endif -%}
+'''
 
-    {%- if show_table %}
-        <div class="tbl">
-            <h2 id="{{ table.outputname | replace('.', '_') }}">{{ table.outputname }}</h2>
+HTML_TABLES_TEMPLATE = '''
+    {% for table in tables %}
+        <div class="tbl{% if table.status %} {{ table.status }}{% endif %}">
+            <h2 id="{{ table.node_id }}">{{ table.outputname }}</h2>
+            {%- if table.collapsed %}
+            <p>{{ table.collapsed }}</p>
+            {%- endif %}
+            {%- if table.heat %}
+            <p>{{ table.heat.label }}</p>
+            {%- endif %}
             <TABLE>
                 <tr><th></th><th>Column</th><th>Type</th><th>Description</th></tr>
-              {% for column in table.columns -%}
-
-                {%- set show_col = False -%}
-                {%- if oid in key_columns -%}
-                  {%- if column.colname in key_columns[oid] -%}
-                    {%- set show_col = True -%}
-                  {%- endif -%}
-                {%- else -%}
-                  {%- set show_col = True -%}
-                {%- endif -%}
-
-                {%- if show_col -%}
-                {%- set from_table_col = table.outputname.replace('.', '_') ~ ":" ~ column.colname %}
-                <TR>
-                    <TD>
-                        {%- if column.colname == table.pk %}#{% elif not column.is_nullable %}*{% endif -%}
-                    </TD>
-                    <TD id="{{ from_table_col }}">
-                        {%- if from_table_col in fks -%}
-                          {%- set to_table_col = fks[from_table_col] -%}
-                          <a href="#{{ to_table_col }}" title="{{ to_table_col }}">{{ column.colname }}</a>
+              {% for column in table.columns %}
+                <TR{% if column.status %} class="{{ column.status }}"{% endif %}>
+                    <TD>{{ column.flag }}</TD>
+                    <TD id="{{ column.port_id }}">
+                        {%- if column.fk -%}
+                          <a href="#{{ column.fk }}" title="{{ column.fk }}">{{ column.colname }}</a>
                         {%- else -%}
-                          {{ column.colname }}</TD>
-                        {%- endif %}
+                          {{ column.colname }}
+                        {%- endif -%}
+                    </TD>
                     <TD>{{ column.coltype }}</TD>
                     <TD>{{ column.coldesc }}</TD>
                 </TR>
-                {% endif -%}
-
-              {%- endfor %}
-              {%- if table.uk -%}
+              {% endfor %}
+              {%- if table.uk %}
                 <tr><td colspan="4" height="1"></td></tr>
-              {%- endif -%}
+              {%- endif %}
               {%- for uk in table.uk %}
                 <tr><td colspan="4">Unique({{ uk.columns }})</td></tr>
               {%- endfor %}
-
-              {%- if show_constraint -%}
-              {%- if table.checks -%}
+              {%- if table.checks %}
                 <tr><td colspan="4" height="1"></td></tr>
-              {%- endif -%}
+              {%- endif %}
               {%- for check in table.checks %}
                 <tr><td colspan="4">{{ check.cons_src }}</td></tr>
-              {%- endfor -%}
+              {%- endfor %}
+              {%- if table.index_warnings %}
+                <tr><td colspan="4" height="1"></td></tr>
               {%- endif %}
+              {%- for warning in table.index_warnings %}
+                <tr class="index_warning"><td colspan="4">{{ warning }}</td></tr>
+              {%- endfor %}
             </TABLE>
         </div>
-    {% endif -%}
-    {%- endfor %}
-</body>
-<script type = "text/javascript">
+    {% endfor %}
+'''
+
+# the heat overlay as one table, sorted by a click on a column
+HTML_HEAT_TEMPLATE = '''
+        <div class="heat">
+            <h2>Heat</h2>
+            <TABLE>
+                <thead><tr>
+                    <th data-sort="text">Table</th>
+                    <th data-sort="number">Rows</th>
+                    <th data-sort="number">Size</th>
+                    <th data-sort="number">Seq scans</th>
+                    <th data-sort="number">Index scans</th>
+                    <th data-sort="number">Inserts</th>
+                    <th data-sort="number">Updates</th>
+                    <th data-sort="number">Deletes</th>
+                </tr></thead>
+                <tbody>
+              {%- for table in tables if table.heat %}
+                <TR>
+                    <TD data-value="{{ table.outputname }}">
+                        <a href="#{{ table.node_id }}">{{ table.outputname }}</a></TD>
+                    <TD data-value="{{ table.heat.rows }}">{{ '{:,}'.format(table.heat.rows) }}</TD>
+                    <TD data-value="{{ table.heat.bytes }}">{{ table.heat.size }}</TD>
+                    <TD data-value="{{ table.heat.seq_scan }}">{{ '{:,}'.format(table.heat.seq_scan) }}</TD>
+                    <TD data-value="{{ table.heat.idx_scan }}">{{ '{:,}'.format(table.heat.idx_scan) }}</TD>
+                    <TD data-value="{{ table.heat.n_tup_ins }}">{{ '{:,}'.format(table.heat.n_tup_ins) }}</TD>
+                    <TD data-value="{{ table.heat.n_tup_upd }}">{{ '{:,}'.format(table.heat.n_tup_upd) }}</TD>
+                    <TD data-value="{{ table.heat.n_tup_del }}">{{ '{:,}'.format(table.heat.n_tup_del) }}</TD>
+                </TR>
+              {%- endfor %}
+                </tbody>
+            </TABLE>
+        </div>
+'''
+
+HTML_HEAT_SCRIPT_TEMPLATE = '''
+    // sort the heat table by the clicked column, a click on the same column again reverses the order
+    $(document).on('click', '.heat th[data-sort]', function() {
+        var index = $(this).index(), number = $(this).data('sort') == 'number';
+        var desc = !$(this).hasClass('desc');
+        $(this).siblings().removeClass('desc asc');
+        $(this).removeClass('desc asc').addClass(desc ? 'desc' : 'asc');
+        var tbody = $(this).closest('table').children('tbody');
+        var rows = tbody.children('tr').get();
+        rows.sort(function(a, b) {
+            var x = $(a).children().eq(index).data('value'), y = $(b).children().eq(index).data('value');
+            var order = number ? x - y : String(x).localeCompare(String(y));
+            return desc ? -order : order;
+        });
+        tbody.append(rows);
+    });
+'''
+
+HTML_MENU_SCRIPT_TEMPLATE = '''
     function toggle_menu(me) {
         $(".menu .real_menu").toggle();
         if ( $(me).text() == 'close' ) {
@@ -374,14 +665,280 @@ a:hover, a:focus, a:active {
             $(".menu").css('position', 'fixed');
         }
     }
+'''
+
+HTML_TEMPLATE = '''
+<!DOCTYPE html>
+<html lang="zh-CN" class="">
+<head>
+<meta charset="utf-8">
+<meta http-equiv="X-UA-Compatible" content="IE=edge,chrome=1" />
+<meta name="renderer" content="webkit" />
+<title>{{ db_name }}</title>
+<script
+  src="https://code.jquery.com/jquery-3.1.1.min.js"
+  integrity="sha256-hVVnYaiADRTO2PzUGmuLJr8BLUSjGIZsDYGmIJLv2b8="
+  crossorigin="anonymous"></script>
+{% include 'html_style' %}
+</head>
+<body>
+<div class='menu'>
+<div style='float:right'>
+    <span onClick='toggle_menu(this)'>close</span><span> | </span>
+    <span onClick='toggle_pin(this)'>unpin</span>
+</div>
+<div style='float:left' class='real_menu'>
+    {%- for schema, schema_tables in menu %}
+    <span>{{ schema }}</span>
+    <ul>
+        {%- for table in schema_tables -%}
+        <li><a href='#{{ table.node_id }}'>{{ table.tablename }}</a></li>
+        {%- endfor -%}
+    </ul>
+    {%- endfor %}
+</div>
+</div>
+
+{%- if heat %}
+{% include 'html_heat' %}
+{%- endif %}
+
+{% include 'html_tables' %}
+</body>
+<script type = "text/javascript">
+{% include 'html_menu_script' %}
+{%- if heat %}
+{% include 'html_heat_script' %}
+{%- endif %}
+
+    // one handler on the document, instead of one for every anchor
+    $(document).on('click', 'a', function() {
+        var par = $(document.getElementById(this.hash.substr(1))).parent();
+        par.fadeOut();
+        par.fadeIn();
+    });
+</script>
+</html>
+'''
+
+HTML_SHARD_INDEX_TEMPLATE = '''
+<!DOCTYPE html>
+<html lang="zh-CN" class="">
+<head>
+<meta charset="utf-8">
+<meta http-equiv="X-UA-Compatible" content="IE=edge,chrome=1" />
+<meta name="renderer" content="webkit" />
+<title>{{ db_name }}</title>
+<script
+  src="https://code.jquery.com/jquery-3.1.1.min.js"
+  integrity="sha256-hVVnYaiADRTO2PzUGmuLJr8BLUSjGIZsDYGmIJLv2b8="
+  crossorigin="anonymous"></script>
+{% include 'html_style' %}
+</head>
+<body>
+<div class='menu'>
+<div style='float:right'>
+    <span onClick='toggle_menu(this)'>close</span><span> | </span>
+    <span onClick='toggle_pin(this)'>unpin</span>
+</div>
+<div style='float:left' class='real_menu'>
+    <input id='search' type='text' placeholder='table or column' />
+    <ul id='results'></ul>
+    <ul>
+        {%- for shard in shards %}
+        <li><a href='#' data-shard='{{ loop.index0 }}'>{{ shard.name }}</a> ({{ shard.tables }})</li>
+        {%- endfor %}
+    </ul>
+</div>
+</div>
+
+<h1>{{ db_name }}</h1>
+<div id='tables'></div>
+</body>
+<script type = "text/javascript">
+{% include 'html_menu_script' %}
+    // the shards and the search index are js files which call these functions, so they can be loaded with a
+    // script tag, which works for file:// too
+    var shards = {{ shards | map(attribute='output') | list | tojson }};
+    var loaded = {}, waiting = {};
+    var search_index = [], shard_of = {};
+
+    function uml_search_index(entries) {
+        search_index = entries;
+        $.each(entries, function(i, entry) {
+            shard_of[entry[1]] = entry[2];
+        });
+    }
+
+    function uml_shard(id, html) {
+        loaded[id] = true;
+        $('#tables').append($('<div>').attr('data-shard', id).html(html));
+        $.each(waiting[id], function(i, callback) {
+            callback();
+        });
+        delete waiting[id];
+    }
+
+    function load_shard(id, callback) {
+        if ( loaded[id] ) {
+            callback();
+            return;
+        }
+        if ( ! waiting[id] ) {
+            waiting[id] = [];
+            var script = document.createElement('script');
+            script.src = shards[id];
+            document.body.appendChild(script);
+        }
+        waiting[id].push(callback);
+    }
 
-    $('a').click(function() {
-        var arr = this.href.split('#');
-        var id = arr[arr.length-1];
-        var par = $(document.getElementById(id)).parent();
+    function show(id) {
+        var target = document.getElementById(id);
+        target.scrollIntoView();
+        var par = $(target).parent();
         par.fadeOut();
         par.fadeIn();
+    }
+
+    function search(text) {
+        var results = $('#results').empty();
+        text = text.toLowerCase();
+        if ( text.length < 2 ) {
+            return;
+        }
+        for ( var i = 0; i < search_index.length && results.children().length < 50; i++ ) {
+            var entry = search_index[i];
+            var columns = $.grep(entry[3], function(column) {
+                return column.toLowerCase().indexOf(text) >= 0;
+            });
+            if ( entry[0].toLowerCase().indexOf(text) >= 0 || columns.length ) {
+                var link = $('<a>').attr('href', '#' + entry[1]).text(entry[0]);
+                results.append($('<li>').append(link).append(columns.length ? ' ' + columns.join(', ') : ''));
+            }
+        }
+    }
+
+    // one handler on the document for all the anchors, the shard of the target is loaded first if needed
+    $(document).on('click', 'a', function(event) {
+        event.preventDefault();
+        var id = this.hash.substr(1);
+        var shard = $(this).data('shard');
+        if ( shard === undefined ) {
+            shard = shard_of[id.split(':')[0]];
+        }
+        if ( shard === undefined ) {
+            return;
+        }
+        load_shard(shard, function() {
+            if ( id ) {
+                show(id);
+            } else {
+                $('#tables > div[data-shard=' + shard + ']')[0].scrollIntoView();
+            }
+        });
+    });
+
+    var timer = null;
+    $('#search').on('input', function() {
+        var text = this.value;
+        clearTimeout(timer);
+        timer = setTimeout(function() { search(text); }, 200);
     });
+
+    var script = document.createElement('script');
+    script.src = {{ search_index | tojson }};
+    document.body.appendChild(script);
 </script>
 </html>
 '''
+
+FLEET_INDEX_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>UML-PG fleet</title>
+<style type="text/css">
+table { border-collapse:collapse; }
+table th, table td { line-height:18px; padding:8px 12px; text-align:left; border-bottom:solid 1px #eee; }
+table th { background-color:#2A7AD2; color:#fff; }
+.error { color:#D2402A; }
+</style>
+</head>
+<body>
+<table>
+    <tr><th>Cluster</th><th>Database</th><th>Tables</th><th>Seconds</th><th>Output</th></tr>
+    {%- for target in targets %}
+    <tr>
+        <td>{{ target.host }}:{{ target.port }}</td>
+        <td>{{ target.dbname }}</td>
+        <td>{{ target.tables }}</td>
+        <td>{{ '%.2f' | format(target.seconds) }}</td>
+        {%- if target.error %}
+        <td class="error">{{ target.error }}</td>
+        {%- else %}
+        <td><a href="{{ target.output }}">{{ target.output }}</a></td>
+        {%- endif %}
+    </tr>
+    {%- endfor %}
+</table>
+</body>
+</html>
+'''
+
+SPLIT_INDEX_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{{ db_name }}</title>
+<style type="text/css">
+table { border-collapse:collapse; }
+table th, table td { line-height:18px; padding:8px 12px; text-align:left; border-bottom:solid 1px #eee; }
+table td { vertical-align:top; }
+table th { background-color:#2A7AD2; color:#fff; }
+.error { color:#D2402A; }
+</style>
+</head>
+<body>
+<h1>{{ db_name }}</h1>
+<table>
+    <tr><th>Part</th><th>Tables</th><th>Files</th></tr>
+    {%- for part in parts %}
+    <tr>
+        <td>{{ part.name }}</td>
+        <td>{{ part.tables | join(', ') }}</td>
+        <td>
+            <a href="{{ part.output }}">{{ part.output }}</a>
+            {%- if part.image %} <a href="{{ part.image }}">{{ part.image }}</a>{% endif %}
+            {%- if part.error %} <span class="error">{{ part.error }}</span>{% endif %}
+        </td>
+    </tr>
+    {%- endfor %}
+</table>
+</body>
+</html>
+'''
+
+SERVE_INDEX_TEMPLATE = '''
+<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{{ db_name }}</title>
+</head>
+<body>
+<h1>{{ db_name }}</h1>
+{%- for schema, tables in menu %}
+<h2><a href="/schema/{{ schema | urlencode }}.svg">{{ schema }}</a>
+    (<a href="/schema/{{ schema | urlencode }}.html">html</a>)</h2>
+<ul>
+    {%- for table in tables %}
+    <li><a href="/table/{{ (table.schema ~ '.' ~ table.tablename) | urlencode }}.svg">{{ table.tablename }}</a></li>
+    {%- endfor %}
+</ul>
+{%- endfor %}
+</body>
+</html>
+'''
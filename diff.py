@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""Compare two collected models, e.g. staging and prod, or yesterday's snapshot and today's database.
+
+Tables are matched by schema and name, columns by name, so the comparison is linear in the catalog size and
+doesn't depend on oids. The result is a report of the changes, and a model with only the changed tables and
+their fk neighbors, which is rendered with the changes highlighted.
+"""
+
+import os
+from collections import OrderedDict
+
+from model import Column
+from uml import PGUML
+
+COLUMN_FIELDS = ('coltype', 'is_nullable', 'coldefault', 'coldesc')
+
+
+def node_of(port):
+    return port.split(':', 1)[0]
+
+
+def node_id(outputname):
+    return outputname.replace('.', '_')
+
+
+def index_tables(uml):
+    """outputname -> oid, outputname is "schema.table" or "table" for public, so it's unique"""
+    return OrderedDict((table['outputname'], oid) for oid, table in uml.uml_tables.items())
+
+
+def index_inherits(uml):
+    return OrderedDict(((ih['par_outputname'], ih['chl_outputname']), ih) for ih in uml.uml_table_inherits)
+
+
+def with_status(column, status):
+    return Column(**dict(column, status=status))
+
+
+def compare_sets(old, new):
+    return {'added': sorted(new - old), 'removed': sorted(old - new)}
+
+
+class SchemaDiff():
+    def __init__(self, old, new):
+        self.old = old
+        self.new = new
+        self.old_oids = index_tables(old)
+        self.new_oids = index_tables(new)
+        self.old_tables = OrderedDict((name, old.uml_tables[oid]) for name, oid in self.old_oids.items())
+        self.new_tables = OrderedDict((name, new.uml_tables[oid]) for name, oid in self.new_oids.items())
+        self.old_inherits = index_inherits(old)
+        self.new_inherits = index_inherits(new)
+        self.report = self._compare()
+
+    def _compare_columns(self, old_table, new_table):
+        old_columns = OrderedDict((column['colname'], column) for column in old_table['columns'])
+        new_columns = OrderedDict((column['colname'], column) for column in new_table['columns'])
+        changed = OrderedDict()
+        for colname, new_column in new_columns.items():
+            old_column = old_columns.get(colname)
+            if old_column is None:
+                continue
+            fields = OrderedDict((field, [old_column[field], new_column[field]])
+                                 for field in COLUMN_FIELDS if old_column[field] != new_column[field])
+            if fields:
+                changed[colname] = fields
+
+        result = compare_sets(set(old_columns), set(new_columns))
+        result['changed'] = changed
+        return result if result['added'] or result['removed'] or changed else None
+
+    def _compare_table(self, old_table, new_table):
+        changes = OrderedDict()
+        columns = self._compare_columns(old_table, new_table)
+        if columns:
+            changes['columns'] = columns
+        for field in ('pk', 'tabledesc', 'reltype'):
+            if old_table[field] != new_table[field]:
+                changes[field] = [old_table[field], new_table[field]]
+
+        old_uks = set(uk['columns'] for uk in old_table['uk'])
+        new_uks = set(uk['columns'] for uk in new_table['uk'])
+        if old_uks != new_uks:
+            changes['uk'] = compare_sets(old_uks, new_uks)
+
+        old_checks = set(check['cons_src'] for check in old_table['checks'])
+        new_checks = set(check['cons_src'] for check in new_table['checks'])
+        if old_checks != new_checks:
+            changes['checks'] = compare_sets(old_checks, new_checks)
+        return changes
+
+    def _compare(self):
+        changed = OrderedDict()
+        for name, new_table in self.new_tables.items():
+            old_table = self.old_tables.get(name)
+            if old_table is not None:
+                changes = self._compare_table(old_table, new_table)
+                if changes:
+                    changed[name] = changes
+
+        old_fks, new_fks = self.old.uml_fks, self.new.uml_fks
+        fks = compare_sets(set(old_fks), set(new_fks))
+        fks['added'] = [[port, new_fks[port]] for port in fks['added']]
+        fks['removed'] = [[port, old_fks[port]] for port in fks['removed']]
+        fks['changed'] = [[port, old_fks[port], new_fks[port]]
+                          for port in sorted(set(old_fks) & set(new_fks)) if old_fks[port] != new_fks[port]]
+
+        inherits = compare_sets(set(self.old_inherits), set(self.new_inherits))
+        return OrderedDict([
+            ('tables', OrderedDict([
+                ('added', sorted(set(self.new_tables) - set(self.old_tables))),
+                ('removed', sorted(set(self.old_tables) - set(self.new_tables))),
+                ('changed', changed),
+            ])),
+            ('fks', fks),
+            ('inherits', OrderedDict([
+                ('added', [list(edge) for edge in inherits['added']]),
+                ('removed', [list(edge) for edge in inherits['removed']]),
+            ])),
+        ])
+
+    def has_changes(self):
+        report = self.report
+        return any(report[kind][change] for kind in report for change in report[kind])
+
+    def _table_status(self):
+        """outputname -> added/removed/changed, a table is changed if anything of it or its fks or parents changed"""
+        status = OrderedDict()
+        tables = self.report['tables']
+        for name in tables['changed']:
+            status[name] = 'changed'
+
+        nodes = dict((node_id(name), name) for name in list(self.old_tables) + list(self.new_tables))
+        fks = self.report['fks']
+        for edge in fks['added'] + fks['removed'] + fks['changed']:
+            status.setdefault(nodes[node_of(edge[0])], 'changed')
+        for _, chl in self.report['inherits']['added'] + self.report['inherits']['removed']:
+            status.setdefault(chl, 'changed')
+
+        for name in tables['added']:
+            status[name] = 'added'
+        for name in tables['removed']:
+            status[name] = 'removed'
+        return status
+
+    def _neighbors(self, names):
+        """the tables which have a fk from or to the given tables, in either of the models"""
+        nodes = dict((node_id(name), name) for name in list(self.old_tables) + list(self.new_tables))
+        wanted = set(node_id(name) for name in names)
+        neighbors = set()
+        for fks in (self.old.uml_fks, self.new.uml_fks):
+            for from_port, to_port in fks.items():
+                from_node, to_node = node_of(from_port), node_of(to_port)
+                if from_node in wanted:
+                    neighbors.add(nodes[to_node])
+                if to_node in wanted:
+                    neighbors.add(nodes[from_node])
+        return neighbors
+
+    def _merge_columns(self, name, old_table, new_table):
+        columns_report = self.report['tables']['changed'].get(name, {}).get('columns')
+        if old_table is None or new_table is None:
+            status = 'added' if old_table is None else 'removed'
+            return [with_status(column, status) for column in (new_table or old_table)['columns']]
+        if columns_report is None:
+            return list(new_table['columns'])
+
+        columns = []
+        for column in new_table['columns']:
+            colname = column['colname']
+            if colname in columns_report['added']:
+                columns.append(with_status(column, 'added'))
+            elif colname in columns_report['changed']:
+                columns.append(with_status(column, 'changed'))
+            else:
+                columns.append(column)
+        for column in old_table['columns']:
+            if column['colname'] in columns_report['removed']:
+                columns.append(with_status(column, 'removed'))
+        return columns
+
+    def merged(self, opts):
+        """a model with the changed tables and their fk neighbors, keyed by outputname, with the status of the
+        tables, columns, fks and inherits, so the normal templates can highlight them"""
+        status = self._table_status()
+        shown = set(status) | self._neighbors(status)
+
+        uml = PGUML(opts)
+        uml.db_name = '{} -> {}'.format(self.old.db_name, self.new.db_name)
+        uml.only_related = True
+        uml.uml_related_tables = shown
+
+        names = sorted(shown, key=lambda name: ((self.new_tables.get(name) or self.old_tables[name])['schema'], name))
+        for name in names:
+            old_table, new_table = self.old_tables.get(name), self.new_tables.get(name)
+            table = dict(new_table or old_table, status=status.get(name))
+            table['columns'] = self._merge_columns(name, old_table, new_table)
+            uml.uml_tables[name] = table
+
+            key_columns = set()
+            for model, oids in ((self.old, self.old_oids), (self.new, self.new_oids)):
+                if name in oids:
+                    key_columns |= model.uml_key_columns.get(oids[name], set())
+            uml.uml_key_columns[name] = key_columns
+
+        fks = self.report['fks']
+        uml.uml_fks.update(self.new.uml_fks)
+        for port, to_port in fks['removed']:
+            uml.uml_fks[port] = to_port
+            uml.uml_fk_status[port] = 'removed'
+        for port, _ in fks['added']:
+            uml.uml_fk_status[port] = 'added'
+        for port, _, _ in fks['changed']:
+            uml.uml_fk_status[port] = 'changed'
+
+        added = set(tuple(edge) for edge in self.report['inherits']['added'])
+        for edge, ih in self.new_inherits.items():
+            uml.uml_table_inherits.append(dict(ih, status='added') if edge in added else ih)
+        for edge in self.report['inherits']['removed']:
+            uml.uml_table_inherits.append(dict(self.old_inherits[tuple(edge)], status='removed'))
+        return uml
+
+
+def load_side(source, opts):
+    """a side of the diff is a snapshot file saved by --save-snapshot, or a "host:port/dbname" target"""
+    from argparse import Namespace
+    side_opts = Namespace(**vars(opts))
+    side_opts.save_snapshot = None
+    if os.path.isfile(source):
+        from snapshot import load_snapshot
+        uml = PGUML(side_opts)
+        load_snapshot(uml, source)
+        return uml
+
+    from fleet import parse_target
+    side_opts.__dict__.update(parse_target(source, opts))
+    uml = PGUML(side_opts)
+    try:
+        uml._collect_data()
+    finally:
+        uml.close()
+    return uml
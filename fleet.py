@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""Fleet mode, render many databases of many clusters in one run."""
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from renderers import extension
+from uml import DB, PGUML, Logger, get_environment, safe_filename
+
+SQL_DATABASES = '''
+    select
+        datname
+    from
+        pg_catalog.pg_database
+    where
+        datallowconn and not datistemplate
+    order by datname
+'''
+
+# host can be a unix socket directory like /var/run/postgresql
+TARGET_PATTERN = re.compile(r'^(?P<host>[^:]+?)(:(?P<port>\d+))?/(?P<dbname>[^/]+)$')
+
+
+def parse_target(target, opts):
+    """a target is "host:port/dbname" or a dict with host, port, dbname, user and password,
+    the missing ones are taken from the command line"""
+    if not isinstance(target, dict):
+        match = TARGET_PATTERN.match(target.strip())
+        if not match:
+            raise ValueError('Bad target "{}", should be "host:port/dbname"'.format(target))
+        target = dict((key, value) for key, value in match.groupdict().items() if value is not None)
+
+    return {
+        'host': target.get('host', opts.host),
+        'port': str(target.get('port', opts.port)),
+        'dbname': target.get('dbname', opts.dbname),
+        'user': target.get('user', opts.user),
+        'password': target.get('password', opts.password),
+    }
+
+
+def load_inventory(path, opts):
+    with open(path) as f:
+        content = f.read()
+
+    if path.endswith('.json'):
+        targets = json.loads(content)
+    elif path.endswith(('.yaml', '.yml')):
+        try:
+            import yaml
+        except ImportError:
+            raise ImportError('PyYAML is needed for a yaml inventory, install it with `pip install pyyaml`')
+        targets = yaml.safe_load(content)
+    else:
+        targets = [line for line in content.splitlines() if line.strip() and not line.strip().startswith('#')]
+
+    if isinstance(targets, dict):
+        targets = targets['targets']
+    return [parse_target(target, opts) for target in targets]
+
+
+def target_path(path, name):
+    """the file of one target for a path given for all of them, e.g. snaps/prod.json.gz -> snaps/prod_name.json.gz"""
+    directory, filename = os.path.split(path)
+    stem, dot, extension = filename.partition('.')
+    return os.path.join(directory, '{}_{}{}{}'.format(stem, name, dot, extension))
+
+
+class Fleet():
+    def __init__(self, opts):
+        self.logger = Logger('Fleet').logger
+        self.opts = opts
+        self.output_dir = opts.output_dir
+        self.fleet_jobs = max(1, opts.fleet_jobs)
+        self.cluster_jobs = max(1, opts.cluster_jobs)
+        self.targets = load_inventory(opts.inventory, opts)
+        self.cluster_locks = {}
+
+    def _expand_targets(self):
+        """replace "host:port/*" with all the databases of the cluster, one connection for each cluster"""
+        targets = []
+        for target in self.targets:
+            if target['dbname'] != '*':
+                targets.append(target)
+                continue
+
+            db = DB(**dict(target, dbname='postgres', prepare=False))
+            try:
+                for row in db.execute_sql(SQL_DATABASES):
+                    targets.append(dict(target, dbname=row[0]))
+            finally:
+                db.close()
+        return targets
+
+    def _render(self, target):
+        cluster = (target['host'], target['port'])
+        result = OrderedDict([
+            ('host', target['host']),
+            ('port', target['port']),
+            ('dbname', target['dbname']),
+            ('tables', 0),
+            ('seconds', 0.0),
+            ('output', None),
+            ('error', None),
+            ('stats', None),
+            ('index_report', None),
+            ('snapshot', None),
+        ])
+
+        # a connection is bound to one database, so limit the connections per cluster instead
+        with self.cluster_locks[cluster]:
+            start = time.time()
+            opts = argparse.Namespace(**vars(self.opts))
+            opts.__dict__.update(target)
+            opts.stats = None  # the stats of every database are put in index.json instead
+            # so is the index report, every database would write the same file
+            opts.check_indexes = opts.check_indexes or bool(opts.index_report)
+            opts.index_report = None
+            db_name = "{}_{}_{}".format(target['host'], target['port'], target['dbname'])
+            if opts.save_snapshot:
+                opts.save_snapshot = target_path(opts.save_snapshot, safe_filename(db_name))
+            result['output'] = '{}.{}'.format(safe_filename(db_name), extension(opts.format))
+            opts.output = os.path.join(self.output_dir, result['output'])
+            if opts.split or (opts.format == 'html' and opts.html_shard):
+                # many files for one database, so each database gets its own directory
+                result['output'] = '{}/index.html'.format(safe_filename(db_name))
+                opts.output_dir = os.path.join(self.output_dir, safe_filename(db_name))
+            try:
+                uml = PGUML(opts)
+                try:
+                    uml.go()
+                finally:
+                    uml.close()
+                result['tables'] = len(uml.uml_tables)
+                result['stats'] = uml.stats.report()
+                if self.opts.index_report:
+                    result['index_report'] = uml._index_check()[0]
+                result['snapshot'] = opts.save_snapshot
+            except Exception as err:
+                self.logger.error('Render {} failed: {}'.format(db_name, err))
+                result['error'] = str(err)
+                result['output'] = None
+            result['seconds'] = time.time() - start
+        return result
+
+    def _write_index(self, results):
+        with open(os.path.join(self.output_dir, 'index.json'), 'w') as f:
+            json.dump(results, f, indent=2)
+
+        template = get_environment().get_template('fleet_index')
+        with open(os.path.join(self.output_dir, 'index.html'), 'w', encoding='utf-8') as f:
+            for chunk in template.generate(targets=results):
+                f.write(chunk)
+
+    def go(self):
+        """render all the targets, return False if any of them failed"""
+        if not os.path.isdir(self.output_dir):
+            os.makedirs(self.output_dir)
+
+        targets = self._expand_targets()
+        for target in targets:
+            cluster = (target['host'], target['port'])
+            self.cluster_locks.setdefault(cluster, threading.BoundedSemaphore(self.cluster_jobs))
+
+        with ThreadPoolExecutor(max_workers=self.fleet_jobs) as executor:
+            results = list(executor.map(self._render, targets))
+
+        self._write_index(results)
+        return all(result['error'] is None for result in results)
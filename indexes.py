@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Check the indexes of the tables: the fks which no index covers, which make a delete or update of the referenced
+table scan the referencing one, and lock it for the whole scan, and the indexes which are the same as, or a
+leading part of, another index, which only slow down the writes.
+
+An fk is covered by an index whose leading columns are the fk columns, in any order. The partial indexes don't
+cover anything, and only the plain btree indexes are checked for redundancy, as the others can't be compared by
+their columns."""
+
+from collections import OrderedDict
+
+
+def covers(index, columns):
+    """if the leading columns of `index` are `columns`"""
+    keys = index['columns'][:len(columns)]
+    if index['predicate'] is not None or len(keys) < len(columns) or None in keys:
+        return False
+    if index['method'] == 'hash':
+        return len(columns) == 1 and keys == columns
+    return index['method'] == 'btree' and set(keys) == set(columns)
+
+
+def _keep_first(index):
+    """the index to keep among the duplicates: the one of the pk or a unique constraint, then by name"""
+    return (not index['is_primary'], not index['is_unique'], index['index_name'])
+
+
+def check_table(table):
+    """(unindexed fks, duplicate indexes, redundant indexes) of a table, see `check_indexes`"""
+    indexes = sorted(table.get('indexes', []), key=_keep_first)
+    unindexed = [fk for fk in table.get('fk_columns', [])
+                 if not any(covers(index, fk['columns']) for index in indexes)]
+
+    duplicates, redundant, seen = [], [], {}
+    for index in indexes:
+        key = (index['method'], tuple(index['columns']), index['expressions'], index['predicate'])
+        if key in seen:
+            duplicates.append((index, seen[key]))
+            continue
+        seen[key] = index
+
+    duplicated = set(index['index_name'] for index, _ in duplicates)
+    plain = [index for index in indexes if index['index_name'] not in duplicated and index['method'] == 'btree'
+             and index['expressions'] is None and index['predicate'] is None]
+    for index in plain:
+        if index['is_unique']:
+            continue  # it enforces a constraint
+        for other in plain:
+            if len(other['columns']) > len(index['columns']) and \
+                    other['columns'][:len(index['columns'])] == index['columns']:
+                redundant.append((index, other))
+                break
+    return unindexed, duplicates, redundant
+
+
+def check_indexes(uml_tables):
+    """return the report of all the tables, and oid -> the warnings to show in the table"""
+    report = OrderedDict([
+        ('unindexed_fks', []),
+        ('duplicate_indexes', []),
+        ('redundant_indexes', []),
+    ])
+    warnings = {}
+    for oid, table in uml_tables.items():
+        unindexed, duplicates, redundant = check_table(table)
+        messages = []
+        for fk in unindexed:
+            report['unindexed_fks'].append(OrderedDict([
+                ('table', table['outputname']),
+                ('constraint', fk['cons_name']),
+                ('columns', fk['columns']),
+                ('references', uml_tables[fk['ref_oid']]['outputname'] if fk['ref_oid'] in uml_tables else None),
+            ]))
+            messages.append('No index for fk {}({})'.format(fk['cons_name'], ', '.join(fk['columns'])))
+        for index, other in duplicates:
+            report['duplicate_indexes'].append(OrderedDict([
+                ('table', table['outputname']),
+                ('index', index['index_name']),
+                ('columns', index['columns']),
+                ('bytes', index['index_bytes']),
+                ('duplicate_of', other['index_name']),
+            ]))
+            messages.append('Index {} is the same as {}'.format(index['index_name'], other['index_name']))
+        for index, other in redundant:
+            report['redundant_indexes'].append(OrderedDict([
+                ('table', table['outputname']),
+                ('index', index['index_name']),
+                ('columns', index['columns']),
+                ('bytes', index['index_bytes']),
+                ('covered_by', other['index_name']),
+            ]))
+            messages.append('Index {} is covered by {}'.format(index['index_name'], other['index_name']))
+        if messages:
+            warnings[oid] = messages
+    return report, warnings
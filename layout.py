@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""Run graphviz to make images from dot files, with an optional cache keyed by the content of the dot file, so a
+diagram which doesn't change is never laid out again."""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+
+from uml import Logger
+
+logger = Logger('layout').logger
+
+
+def hash_chunks(chunks, digest):
+    """pass the chunks through, and hash them on the way"""
+    for chunk in chunks:
+        digest.update(chunk.encode('utf-8'))
+        yield chunk
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest
+
+
+def run_graphviz(source, target, image_format, engine):
+    """lay out the dot file `source` to the image file `target`, "-" is stdout"""
+    cmd = ['dot', '-K{}'.format(engine), '-T{}'.format(image_format), source]
+    if target != '-':
+        cmd[-1:-1] = ['-o', target]
+    else:
+        sys.stdout.flush()
+    try:
+        subprocess.run(cmd, check=True, stdout=sys.stdout.buffer if target == '-' else subprocess.DEVNULL,
+                       stderr=subprocess.PIPE)
+    except subprocess.CalledProcessError as err:
+        logger.error('Run "{}" failed: {}'.format(' '.join(cmd), err.stderr.decode('utf-8', 'replace').strip()))
+        raise
+    except OSError as err:
+        logger.error('Run "{}" failed, is graphviz installed? {}'.format(' '.join(cmd), err))
+        raise
+
+
+def render_image(source, target, image_format, engine='dot', cache_dir=None, digest=None):
+    """make the image of the dot file `source`, if `cache_dir` is given, the image is kept there by the hash of
+    the dot file, the engine and the format, and graphviz is only run when the image is not there.
+    `digest` is the hash of the dot file if it's known already"""
+    if cache_dir is None:
+        run_graphviz(source, target, image_format, engine)
+        return
+
+    if digest is None:
+        digest = file_digest(source)
+    key = hashlib.sha256('{}/{}/{}'.format(digest.hexdigest(), engine, image_format).encode('utf-8')).hexdigest()
+    cached = os.path.join(cache_dir, key[:2], '{}.{}'.format(key, image_format))
+    if os.path.exists(cached):
+        logger.debug('Use cached image {}'.format(cached))
+    else:
+        if not os.path.isdir(os.path.dirname(cached)):
+            os.makedirs(os.path.dirname(cached))
+        run_graphviz(source, cached + '.tmp', image_format, engine)
+        os.replace(cached + '.tmp', cached)
+
+    if target == '-':
+        sys.stdout.flush()
+        with open(cached, 'rb') as f:
+            shutil.copyfileobj(f, sys.stdout.buffer)
+        sys.stdout.buffer.flush()
+    else:
+        shutil.copyfile(cached, target)
@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+"""The compact model of PGUML: tables and columns are objects with __slots__ instead of dicts, the names which
+repeat a lot are interned, and the fks are kept as oids and column names in arrays. They all still work like the
+dicts they replace, so the code which reads the model doesn't change."""
+
+import sys
+from array import array
+from collections.abc import Mapping, MutableMapping
+
+
+def intern(value):
+    """the shared copy of a name, e.g. a type or a column name, which repeats in many tables"""
+    return sys.intern(value) if type(value) is str else value
+
+
+class Record(MutableMapping):
+    """a dict with a fixed set of keys, the __slots__ of a subclass, which takes much less memory than a dict.
+    a key which is not set is not in it, like a dict"""
+
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        try:
+            for key, value in fields.items():
+                setattr(self, key, value)
+        except AttributeError:
+            raise KeyError('{} has no field {}'.format(type(self).__name__, key))
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError('{} has no field {}'.format(type(self).__name__, key))
+        setattr(self, key, value)
+
+    def __delitem__(self, key):
+        try:
+            delattr(self, key)
+        except (AttributeError, TypeError):
+            raise KeyError(key)
+
+    def __iter__(self):
+        return (key for key in self.__slots__ if hasattr(self, key))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, dict(self))
+
+
+class Table(Record):
+    __slots__ = ('schema', 'tablename', 'outputname', 'tabledesc', 'reltype', 'columns', 'checks', 'pk', 'uk',
+                 'collapsed', 'heat', 'fk_columns', 'indexes', 'status')
+
+
+class Column(Record):
+    __slots__ = ('colname', 'coldesc', 'coltype', 'is_nullable', 'coldefault', 'status')
+
+    def __init__(self, colname, coldesc, coltype, is_nullable, coldefault, status=None):
+        # set directly, there are millions of them
+        self.colname = colname
+        self.coldesc = coldesc
+        self.coltype = coltype
+        self.is_nullable = is_nullable
+        self.coldefault = coldefault
+        if status is not None:
+            self.status = status
+
+
+class ViewColumn(Mapping):
+    """a column of the view, see `PGUML._build_view`: the column record and the fields computed for the templates,
+    the name, type and desc are read from the record, so they are not copied for every view"""
+
+    __slots__ = ('column', 'node_id', 'flag', 'fk')
+    fields = ('colname', 'coltype', 'coldesc', 'flag', 'port_id', 'fk', 'status')
+
+    def __init__(self, column, node_id, flag, fk):
+        self.column = column
+        self.node_id = node_id
+        self.flag = flag
+        self.fk = fk
+
+    @property
+    def colname(self):
+        return self.column.colname
+
+    @property
+    def coltype(self):
+        return self.column.coltype
+
+    @property
+    def coldesc(self):
+        return self.column.coldesc
+
+    @property
+    def port_id(self):
+        return '{}:{}'.format(self.node_id, self.column.colname)
+
+    @property
+    def status(self):
+        return self.column.get('status')
+
+    def __getitem__(self, key):
+        if key not in self.fields:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self.fields)
+
+    def __len__(self):
+        return len(self.fields)
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, dict(self))
+
+
+class FkEdges(Mapping):
+    """from port -> to port of the fks, e.g. "orders:customer_id" -> "customers:id", like a dict. The edges are
+    kept as the oids of the tables and the column names, a port is only made when it's read, and the edges of a
+    table are linked by their index, so there is no dict entry for each fk. The edges set by port, e.g. by the
+    diff, whose tables are not known by oid, are kept as they are"""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.from_oids = array('I')
+        self.to_oids = array('I')
+        self.from_columns = []
+        self.to_columns = []
+        self.next_edges = array('i')  # the index of the next edge from the same table, -1 for the last one
+        self.first_edges = {}  # from oid -> the index of its first edge
+        self.ports = {}
+        self.node_ports = {}  # from node id -> column name -> to port of the edges in `ports`, see `targets`
+        self._node_oids = None
+
+    def _node_id(self, oid):
+        return self.tables[oid]['outputname'].replace('.', '_')
+
+    def _find(self, oid, colname):
+        idx = self.first_edges.get(oid, -1)
+        while idx >= 0 and self.from_columns[idx] != colname:
+            idx = self.next_edges[idx]
+        return idx
+
+    def add(self, from_oid, from_colname, to_oid, to_colname):
+        """add the fk from the column of a table to the column of another one, one column only has one fk"""
+        idx = self._find(from_oid, from_colname)
+        if idx >= 0:
+            self.to_oids[idx] = to_oid
+            self.to_columns[idx] = intern(to_colname)
+            return
+        self.from_oids.append(from_oid)
+        self.to_oids.append(to_oid)
+        self.from_columns.append(intern(from_colname))
+        self.to_columns.append(intern(to_colname))
+        self.next_edges.append(self.first_edges.get(from_oid, -1))
+        self.first_edges[from_oid] = len(self.from_oids) - 1
+
+    def targets(self, oid):
+        """column name -> to port of the fks from a table, all at once"""
+        targets = {}
+        if self.node_ports:
+            targets.update(self.node_ports.get(self._node_id(oid), ()))
+        idx = self.first_edges.get(oid, -1)
+        while idx >= 0:
+            targets[self.from_columns[idx]] = '{}:{}'.format(self._node_id(self.to_oids[idx]), self.to_columns[idx])
+            idx = self.next_edges[idx]
+        return targets
+
+    def target(self, oid, colname):
+        """the to port of the fk from a column, None if there is none, which is faster than by the from port"""
+        idx = self._find(oid, colname)
+        if idx >= 0:
+            return '{}:{}'.format(self._node_id(self.to_oids[idx]), self.to_columns[idx])
+        if self.node_ports:
+            return self.node_ports.get(self._node_id(oid), {}).get(colname)
+        return None
+
+    def node_oids(self):
+        """node id -> oid of the tables, made again when the tables are changed"""
+        if self._node_oids is None or len(self._node_oids) != len(self.tables):
+            self._node_oids = dict((self._node_id(oid), oid) for oid in self.tables)
+        return self._node_oids
+
+    def __getitem__(self, port):
+        if port in self.ports:
+            return self.ports[port]
+        node, _, colname = port.partition(':')
+        oid = self.node_oids().get(node)
+        to_port = self.target(oid, colname) if oid is not None else None
+        if to_port is None:
+            raise KeyError(port)
+        return to_port
+
+    def __setitem__(self, port, to_port):
+        node_oids = self.node_oids()
+        from_node, _, from_colname = port.partition(':')
+        to_node, _, to_colname = to_port.partition(':')
+        from_oid, to_oid = node_oids.get(from_node), node_oids.get(to_node)
+        if type(from_oid) is int and type(to_oid) is int:
+            self.add(from_oid, from_colname, to_oid, to_colname)
+        else:
+            self.ports[port] = to_port
+            self.node_ports.setdefault(from_node, {})[from_colname] = to_port
+
+    def update(self, edges):
+        """add the edges of a mapping or a list of (from port, to port)"""
+        for port, to_port in (edges.items() if isinstance(edges, Mapping) else edges):
+            self[port] = to_port
+
+    def items(self):
+        """(from port, to port) of all the edges, without looking the edges up by the from port again"""
+        for idx, oid in enumerate(self.from_oids):
+            yield ('{}:{}'.format(self._node_id(oid), self.from_columns[idx]),
+                   '{}:{}'.format(self._node_id(self.to_oids[idx]), self.to_columns[idx]))
+        for item in self.ports.items():
+            yield item
+
+    def __iter__(self):
+        for idx, oid in enumerate(self.from_oids):
+            yield '{}:{}'.format(self._node_id(oid), self.from_columns[idx])
+        for port in self.ports:
+            yield port
+
+    def __len__(self):
+        return len(self.from_oids) + len(self.ports)
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""The output formats. Each one is a "module:function" which is only imported when the format is used, the
+function is called as `render(uml, view)` and yields the output piece by piece, `view` is built by
+`PGUML._build_view`."""
+
+import importlib
+from collections import OrderedDict
+
+# format -> ("module:function", file extension)
+RENDERERS = OrderedDict([
+    ('dot', ('renderers.templates:render_dot', 'dot')),
+    ('html', ('renderers.templates:render_html', 'html')),
+    ('mermaid', ('renderers.mermaid:render', 'mmd')),
+    ('plantuml', ('renderers.plantuml:render', 'puml')),
+])
+
+
+def register(name, path, extension=None):
+    """add an output format, e.g. register('json', 'mypackage.json_renderer:render')"""
+    RENDERERS[name] = (path, extension or name)
+
+
+def get_renderer(name):
+    path = RENDERERS[name][0]
+    module, _, function = path.partition(':')
+    return getattr(importlib.import_module(module), function)
+
+
+def extension(name):
+    """the file extension of the format, the image formats are their own extensions"""
+    return RENDERERS[name][1] if name in RENDERERS else name
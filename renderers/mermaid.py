@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""Mermaid erDiagram, written straight from the view, a table at a time."""
+
+import re
+
+
+def identifier(name):
+    """mermaid only takes letters, digits, "_" and "-" in the names"""
+    return re.sub(r'[^\w-]', '_', name)
+
+
+def attribute_type(coltype):
+    """types may also have "()" and "[]", e.g. varchar(100)"""
+    return re.sub(r'[^\w()\[\]-]', '_', coltype)
+
+
+def comment(text):
+    return '"{}"'.format(text.replace('"', "'").replace('\n', ' '))
+
+
+def column_keys(table, column):
+    keys = []
+    if column['flag'] == '#':
+        keys.append('PK')
+    if column['fk']:
+        keys.append('FK')
+    if any(column['colname'] in uk['columns'].split(', ') for uk in table['uk']):
+        keys.append('UK')
+    return ', '.join(keys)
+
+
+def render(uml, view):
+    yield 'erDiagram\n'
+    yield '    %% {}\n'.format(uml.db_name)
+    for table in view['tables']:
+        lines = ['    {} {{'.format(identifier(table['node_id']))]
+        if table['collapsed']:
+            lines.append('        %% {}'.format(table['collapsed']))
+        for column in table['columns']:
+            line = '        {} {}'.format(attribute_type(column['coltype']), identifier(column['colname']))
+            keys = column_keys(table, column)
+            if keys:
+                line += ' ' + keys
+            if column['coldesc']:
+                line += ' ' + comment(column['coldesc'])
+            lines.append(line)
+        lines.append('    }\n')
+        yield '\n'.join(lines)
+
+    lines = []
+    for from_port, to_port, _ in view['fks']:
+        from_node, from_col = from_port.split(':', 1)
+        to_node = to_port.split(':', 1)[0]
+        lines.append('    {} }}o--|| {} : {}'.format(identifier(from_node), identifier(to_node), comment(from_col)))
+    for par_node, chl_node, _ in view['inherits']:
+        lines.append('    {} ||--|| {} : inherits'.format(identifier(chl_node), identifier(par_node)))
+    if lines:
+        yield '\n'.join(lines) + '\n'
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""PlantUML entity diagram, written straight from the view, a table at a time."""
+
+import re
+
+
+def alias(name):
+    return re.sub(r'\W', '_', name)
+
+
+def quote(text):
+    return text.replace('"', "'").replace('\n', ' ')
+
+
+def render(uml, view):
+    yield '@startuml\n'
+    yield 'title {}\n'.format(quote(uml.db_name))
+    yield 'hide circle\nskinparam linetype ortho\n'
+    for table in view['tables']:
+        lines = ['entity "{}" as {} {{'.format(quote(table['outputname']), alias(table['node_id']))]
+        keys, others = [], []
+        for column in table['columns']:
+            line = '  {}{} : {}'.format('* ' if column['flag'] else '', column['colname'], column['coltype'])
+            if column['flag'] == '#':
+                line += ' <<PK>>'
+            if column['fk']:
+                line += ' <<FK>>'
+            if column['coldesc']:
+                line += ' // {}'.format(quote(column['coldesc']))
+            (keys if column['flag'] == '#' else others).append(line)
+        lines.extend(keys)
+        if keys and others:
+            lines.append('  --')
+        lines.extend(others)
+        for uk in table['uk']:
+            lines.append('  .. unique({}) ..'.format(uk['columns']))
+        if table['collapsed']:
+            lines.append('  .. {} ..'.format(table['collapsed']))
+        lines.append('}\n')
+        yield '\n'.join(lines)
+
+    lines = []
+    for from_port, to_port, _ in view['fks']:
+        lines.append('{} }}o--|| {}'.format(alias(from_port.split(':', 1)[0]), alias(to_port.split(':', 1)[0])))
+    for par_node, chl_node, _ in view['inherits']:
+        lines.append('{} <|-- {}'.format(alias(par_node), alias(chl_node)))
+    lines.append('@enduml\n')
+    yield '\n'.join(lines)
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+"""The dot and html outputs, made by the jinja templates in constants.py."""
+
+from uml import get_environment
+
+
+def _generate(name, uml, view):
+    template = get_environment().get_template(name)
+    return template.generate(db_name=uml.db_name, rankdir=uml.dot_rankdir, **view)
+
+
+def render_dot(uml, view):
+    return _generate('dot', uml, view)
+
+
+def render_html(uml, view):
+    return _generate('html', uml, view)
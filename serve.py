@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""Serve the diagrams over http from the model kept in memory, e.g.
+
+    /                           the schemas and their tables
+    /schema/<name>.<format>     all the tables of a schema
+    /table/<name>.<format>      a table and its neighbors, ?depth=1&direction=both
+    /dot?focus=...              the focus mode, ?focus can be given more than once, with ?depth and ?direction
+
+<format> is dot, html, svg ... as --format. The model is refreshed every --watch-interval seconds, only the changed
+relations are fetched. The outputs are kept in a LRU cache and have an ETag, so a browser asks for them again
+without downloading them if nothing is changed."""
+
+import hashlib
+import os
+import re
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from renderers import RENDERERS
+from uml import IMAGE_FORMATS, Logger, get_environment
+
+CONTENT_TYPES = {
+    'dot': 'text/vnd.graphviz; charset=utf-8',
+    'html': 'text/html; charset=utf-8',
+    'svg': 'image/svg+xml',
+    'png': 'image/png',
+    'pdf': 'application/pdf',
+}
+
+PATH_PATTERN = re.compile(r'^/(?P<kind>schema|table)/(?P<name>[^/]+)\.(?P<format>\w+)$')
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super(HTTPError, self).__init__(message)
+        self.status = status
+
+
+class DiagramServer():
+    def __init__(self, uml, bind='127.0.0.1', port=8000, interval=60.0, cache_size=128):
+        self.logger = Logger('DiagramServer').logger
+        self.uml = uml
+        self.address = (bind, port)
+        self.interval = interval
+        self.cache_size = cache_size
+        self.cache = OrderedDict()  # (generation, path, query) -> (etag, content type, body)
+        self.lock = threading.Lock()  # the model and the cache
+        self.generation = 0  # the version of the model, the cached outputs of the older ones are never used
+        self.stopped = threading.Event()
+
+    def refresh(self):
+        """fetch the changed relations, the requests wait for it, which is quick as only the changes are fetched"""
+        try:
+            self.uml._connect()
+            with self.lock:
+                changed = self.uml.refresh(save_cache=self.uml.cache_dir is not None)
+                if changed:
+                    self.generation += 1
+                    self.cache.clear()
+            if changed:
+                self.logger.info('Model of {} is refreshed, {} tables'.format(self.uml.db_name,
+                                                                           len(self.uml.uml_tables)))
+        except Exception as err:
+            # the database may be restarted, connect again next time
+            self.logger.error('Refresh failed: {}'.format(err))
+            self.uml.close()
+
+    def _refresh_loop(self):
+        while not self.stopped.wait(self.interval):
+            self.refresh()
+
+    def _find_oids(self, kind, name, query):
+        if kind == 'schema':
+            oids = [oid for oid, table in self.uml.uml_tables.items() if table['schema'] == name]
+        else:
+            if '.' not in name:
+                name = 'public.' + name
+            oids = self.uml._focus_tables(['~^{}$'.format(re.escape(name))], self._int(query, 'depth', 1),
+                                          self._direction(query))
+        if not oids:
+            raise HTTPError(404, 'No such {}: {}'.format(kind, name))
+        return oids
+
+    def _int(self, query, name, default):
+        try:
+            return int(query.get(name, [default])[0])
+        except ValueError:
+            raise HTTPError(400, '{} should be a number'.format(name))
+
+    def _direction(self, query):
+        direction = query.get('direction', ['both'])[0]
+        if direction not in ('in', 'out', 'both'):
+            raise HTTPError(400, 'direction should be in, out or both')
+        return direction
+
+    def _view(self, path, query):
+        """the view and the format of a request"""
+        if path == '/dot':
+            if not query.get('focus'):
+                raise HTTPError(400, 'focus is needed')
+            oids = self.uml._focus_tables(query['focus'], self._int(query, 'depth', 1), self._direction(query))
+            return self.uml._build_view(oids), 'dot'
+
+        match = PATH_PATTERN.match(path)
+        if not match:
+            raise HTTPError(404, 'Not found: {}'.format(path))
+        if match.group('format') not in RENDERERS and match.group('format') not in IMAGE_FORMATS:
+            raise HTTPError(400, 'Unknown format: {}'.format(match.group('format')))
+        oids = self._find_oids(match.group('kind'), unquote(match.group('name')), query)
+        return self.uml._build_view(oids), match.group('format')
+
+    def _render(self, view, output_format):
+        if output_format not in IMAGE_FORMATS:
+            return ''.join(self.uml._render(output_format, view)).encode('utf-8')
+
+        from layout import render_image
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dot_file = os.path.join(tmp_dir, 'uml.dot')
+            image_file = os.path.join(tmp_dir, 'uml.' + output_format)
+            self.uml._write_output(self.uml._render('dot', view), dot_file)
+            render_image(dot_file, image_file, output_format, self.uml.layout_engine, self.uml.image_cache)
+            with open(image_file, 'rb') as f:
+                return f.read()
+
+    def get(self, url):
+        """(etag, content type, body) of the url, from the cache if possible"""
+        parts = urlsplit(url)
+        query = parse_qs(parts.query)
+        with self.lock:
+            key = (self.generation, parts.path, tuple(sorted((k, tuple(v)) for k, v in query.items())))
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                return self.cache[key]
+            if parts.path == '/':
+                view, output_format = self.uml._build_view(), 'index'
+            else:
+                view, output_format = self._view(parts.path, query)
+
+        # rendered out of the lock, the view doesn't change with the model
+        if output_format == 'index':
+            body = get_environment().get_template('serve_index').render(db_name=self.uml.db_name, **view)
+            body, content_type = body.encode('utf-8'), CONTENT_TYPES['html']
+        else:
+            body = self._render(view, output_format)
+            content_type = CONTENT_TYPES.get(output_format, 'text/plain; charset=utf-8')
+        result = ('"{}"'.format(hashlib.sha1(body).hexdigest()), content_type, body)
+
+        with self.lock:
+            if key[0] == self.generation:
+                self.cache[key] = result
+                while len(self.cache) > self.cache_size:
+                    self.cache.popitem(last=False)
+        return result
+
+    def go(self):
+        self.uml._connect()
+        if self.uml.cache_dir is not None:
+            self.uml._load_cache()
+        self.refresh()
+        threading.Thread(target=self._refresh_loop, daemon=True).start()
+
+        server = ThreadingHTTPServer(self.address, make_handler(self))
+        server.daemon_threads = True
+        sys.stderr.write('Serve {} on http://{}:{}/\n'.format(self.uml.db_name, *server.server_address[:2]))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stopped.set()
+            server.server_close()
+            self.uml.close()
+
+
+def make_handler(diagram_server):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            try:
+                etag, content_type, body = diagram_server.get(self.path)
+            except HTTPError as err:
+                self._send(err.status, 'text/plain; charset=utf-8', str(err).encode('utf-8'))
+                return
+            except Exception as err:
+                diagram_server.logger.error('Render {} failed: {}'.format(self.path, err))
+                self._send(500, 'text/plain; charset=utf-8', str(err).encode('utf-8'))
+                return
+
+            if etag in [tag.strip().replace('W/', '') for tag in self.headers.get('If-None-Match', '').split(',')]:
+                self._send(304, None, b'', etag)
+            else:
+                self._send(200, content_type, body, etag)
+
+        def _send(self, status, content_type, body, etag=None):
+            self.send_response(status)
+            if content_type:
+                self.send_header('Content-Type', content_type)
+            if etag:
+                self.send_header('ETag', etag)
+                self.send_header('Cache-Control', 'no-cache')  # always check the etag
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            diagram_server.logger.debug(format % args)
+
+    return Handler
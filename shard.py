@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""Write the html output as many small shards, one for each schema or for each N tables, with an index page which
+only has the list of shards and a search index of the table and column names. The shards are loaded when they
+are opened, so a catalog of any size opens as fast as a small one."""
+
+import json
+import os
+
+from uml import Logger, get_environment, make_view
+
+SHARD_DIR = 'shards'
+
+
+def parse_html_shard(value):
+    """--html-shard is "schema" or the number of tables in each shard"""
+    if value == 'schema':
+        return value
+    if value.isdigit() and int(value) > 0:
+        return int(value)
+    raise ValueError('--html-shard should be "schema" or a positive number, not "{}"'.format(value))
+
+
+class ShardedHtmlOutput():
+    def __init__(self, uml):
+        self.logger = Logger('ShardedHtmlOutput').logger
+        self.uml = uml
+        self.view = uml._build_view()
+        self.shard_by = parse_html_shard(uml.html_shard)
+
+    def _shards(self):
+        """(name, tables) of each shard"""
+        tables = self.view['tables']
+        if self.shard_by == 'schema':
+            return [(schema, schema_tables) for schema, schema_tables in self.view['menu']]
+
+        shards = []
+        for start in range(0, len(tables), self.shard_by):
+            chunk = tables[start:start + self.shard_by]
+            shards.append(('{} - {}'.format(chunk[0]['outputname'], chunk[-1]['outputname']), chunk))
+        return shards
+
+    def _write_js(self, function, args, path):
+        """a js file which calls `function` with `args`, so it can be loaded by a script tag"""
+        with open(path, 'w') as f:
+            f.write('{}({});\n'.format(function, ', '.join(json.dumps(arg, separators=(',', ':')) for arg in args)))
+
+    def go(self):
+        shard_dir = os.path.join(self.uml.output_dir, SHARD_DIR)
+        if not os.path.isdir(shard_dir):
+            os.makedirs(shard_dir)
+
+        template = get_environment().get_template('html_tables')
+        results, search_index = [], []
+        for shard_id, (name, tables) in enumerate(self._shards()):
+            output = '{}/{:04d}.js'.format(SHARD_DIR, shard_id)
+            results.append({'name': name, 'tables': len(tables), 'output': output})
+            for table in tables:
+                search_index.append([table['outputname'], table['node_id'], shard_id,
+                                     [column['colname'] for column in table['columns']]])
+            path = os.path.join(self.uml.output_dir, output)
+            if self.uml._up_to_date(path, tables):
+                continue
+            # a shard is small, so it is rendered in memory
+            html = template.render(**make_view(tables, self.view['fks'], self.view['inherits']))
+            self._write_js('uml_shard', [shard_id, html], path)
+            self.logger.debug('Write {} tables of {} to {}'.format(len(tables), name, output))
+
+        output = '{}/search.js'.format(SHARD_DIR)
+        self._write_js('uml_search_index', [search_index], os.path.join(self.uml.output_dir, output))
+
+        template = get_environment().get_template('html_shard_index')
+        self.uml._write_output(template.generate(db_name=self.uml.db_name, shards=results, search_index=output),
+                               os.path.join(self.uml.output_dir, 'index.html'))
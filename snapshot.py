@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Save the collected data of PGUML to a file and load it back, so it can be compared or rendered later without
+the database. A snapshot is json, gzip'd if the file name ends with ".gz"."""
+
+import gzip
+import json
+import os
+import sys
+
+from model import Column, Table
+
+SNAPSHOT_FORMAT = 'uml-pg-snapshot'
+
+# 1: the first snapshots, which had no format and version
+SNAPSHOT_VERSION = 2
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def dump_model(uml):
+    """the model of PGUML as json friendly data, the oid keys become [oid, value] pairs. there is no time in it, so
+    the same catalog always makes the same snapshot"""
+    return {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'db_name': uml.db_name,
+        'tables': [[oid, table] for oid, table in uml.uml_tables.items()],
+        'fks': [[from_port, to_port] for from_port, to_port in uml.uml_fks.items()],
+        'key_columns': [[oid, sorted(columns)] for oid, columns in uml.uml_key_columns.items()],
+        'related_tables': sorted(uml.uml_related_tables),
+        'table_inherits': uml.uml_table_inherits,
+    }
+
+
+def load_model(uml, data):
+    """fill the model of PGUML with the data from `dump_model`"""
+    version = data.get('version', 1)
+    if version > SNAPSHOT_VERSION:
+        raise ValueError('The snapshot is version {}, this uml.py only reads up to version {}'.format(
+            version, SNAPSHOT_VERSION))
+
+    uml._reset_model()
+    uml.db_name = data['db_name']
+    for oid, table in data['tables']:
+        table['columns'] = [Column(**column) for column in table['columns']]
+        uml.uml_tables[oid] = Table(**table)
+    uml.uml_fks.update(data['fks'])
+    for oid, columns in data['key_columns']:
+        uml.uml_key_columns[oid] = set(columns)
+    uml.uml_related_tables.update(data['related_tables'])
+    uml.uml_table_inherits.extend(data['table_inherits'])
+
+
+def save_snapshot(uml, path):
+    """write the snapshot to `path`, "-" is stdout"""
+    # the tables and columns are dict like, see model.py
+    content = json.dumps(dump_model(uml), separators=(',', ':'), default=dict).encode('utf-8')
+    if path.endswith('.gz'):
+        content = gzip.compress(content, mtime=0)
+    if path == '-':
+        sys.stdout.buffer.write(content)
+        sys.stdout.buffer.flush()
+        return
+    with open(path + '.tmp', 'wb') as f:
+        f.write(content)
+    # never leave a half written snapshot
+    os.replace(path + '.tmp', path)
+
+
+def load_snapshot(uml, path):
+    """load a snapshot, gzip'd or not"""
+    with open(path, 'rb') as f:
+        content = f.read()
+    if content[:2] == GZIP_MAGIC:
+        content = gzip.decompress(content)
+    load_model(uml, json.loads(content.decode('utf-8')))
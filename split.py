@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""Split mode, write one file for each connected component of the tables or for each schema.
+
+`dot` gets much slower as the graph grows, many small graphs are much faster to layout than one big graph, and
+they can be laid out in parallel.
+"""
+
+import os
+import subprocess
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from layout import render_image
+from renderers import extension
+from uml import IMAGE_FORMATS, Logger, get_environment, make_view, safe_filename
+
+
+def node_of(port):
+    return port.split(':', 1)[0]
+
+
+def build_adjacency(view):
+    """node id -> the node ids linked to it by a fk or an inherit, in both directions"""
+    adjacency = OrderedDict((table['node_id'], set()) for table in view['tables'])
+    edges = [(node_of(fk[0]), node_of(fk[1])) for fk in view['fks']] + [ih[:2] for ih in view['inherits']]
+    for from_node, to_node in edges:
+        adjacency[from_node].add(to_node)
+        adjacency[to_node].add(from_node)
+    return adjacency
+
+
+def connected_components(adjacency):
+    """lists of node ids, the biggest component first"""
+    seen = set()
+    components = []
+    for start in adjacency:
+        if start in seen:
+            continue
+        seen.add(start)
+        component, queue = [], [start]
+        while queue:
+            node = queue.pop()
+            component.append(node)
+            for neighbor in adjacency[node]:
+                if neighbor not in seen:
+                    seen.add(neighbor)
+                    queue.append(neighbor)
+        components.append(component)
+    components.sort(key=len, reverse=True)
+    return components
+
+
+class SplitOutput():
+    def __init__(self, uml):
+        self.logger = Logger('SplitOutput').logger
+        self.uml = uml
+        self.view = uml._build_view()
+        # --format svg means the dot of each part and its svg
+        self.format, self.image_format = uml.format, uml.image_format
+        if self.format in IMAGE_FORMATS:
+            self.format, self.image_format = 'dot', uml.format
+
+    def _parts(self):
+        """(name, tables) of each part, the tables without any fk or inherit are put together in one part"""
+        tables = OrderedDict((table['node_id'], table) for table in self.view['tables'])
+        if self.uml.split == 'schema':
+            parts = OrderedDict()
+            for table in tables.values():
+                parts.setdefault(table['schema'], []).append(table)
+            return list(parts.items())
+
+        parts, unrelated = [], []
+        for component in connected_components(build_adjacency(self.view)):
+            if len(component) == 1:
+                unrelated.append(tables[component[0]])
+                continue
+            members = set(component)
+            parts.append(('{:03d}_{}'.format(len(parts) + 1, component[0]),
+                          [table for table in tables.values() if table['node_id'] in members]))
+        if unrelated:
+            parts.append(('unrelated', unrelated))
+        return parts
+
+    def _render_image(self, part):
+        try:
+            render_image(os.path.join(self.uml.output_dir, part['output']),
+                         os.path.join(self.uml.output_dir, part['image']), self.image_format,
+                         self.uml.layout_engine, self.uml.image_cache)
+        except (OSError, subprocess.CalledProcessError) as err:
+            stderr = getattr(err, 'stderr', None)
+            part['error'] = stderr.decode('utf-8', 'replace').strip() if stderr else str(err)
+            part['image'] = None
+            self.logger.error('Render {} failed: {}'.format(part['output'], part['error']))
+
+    def go(self):
+        if not os.path.isdir(self.uml.output_dir):
+            os.makedirs(self.uml.output_dir)
+
+        results, changed_images = [], []
+        for name, tables in self._parts():
+            filename = safe_filename(name)
+            part = {
+                'name': name,
+                'tables': [table['outputname'] for table in tables],
+                'output': '{}.{}'.format(filename, extension(self.format)),
+                'image': None,
+                'error': None,
+            }
+            view = make_view(tables, self.view['fks'], self.view['inherits'])
+            path = os.path.join(self.uml.output_dir, part['output'])
+            changed = not self.uml._up_to_date(path, view)
+            if changed:
+                self.uml._write_output(self.uml._render(self.format, view), path)
+            if self.format == 'dot' and self.image_format:
+                part['image'] = '{}.{}'.format(filename, self.image_format)
+                if changed or not os.path.exists(os.path.join(self.uml.output_dir, part['image'])):
+                    changed_images.append(part)
+            results.append(part)
+
+        # every dot is a process, so a thread pool is enough to run them in parallel
+        with ThreadPoolExecutor(max_workers=max(1, self.uml.render_jobs)) as executor:
+            list(executor.map(self._render_image, changed_images))
+
+        template = get_environment().get_template('split_index')
+        self.uml._write_output(template.generate(db_name=self.uml.db_name, parts=results),
+                               os.path.join(self.uml.output_dir, 'index.html'))
+        return all(part['error'] is None for part in results)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""Where the time of a run goes: the time and rows of every catalog query, the time of every processing and
+rendering phase, the output size and the peak memory. Written as json by --stats, and every measure is also
+passed to the hooks, e.g. to forward them to a metrics system."""
+
+import importlib
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:  # not on windows
+    resource = None
+
+
+def peak_rss():
+    """peak resident memory of this process in bytes, None if unknown"""
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macos, kilobytes on the others
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def load_hook(path):
+    """"package.module:function" -> the function"""
+    module, _, name = path.partition(':')
+    if not name:
+        raise ValueError('A stats hook should be "module:function", not "{}"'.format(path))
+    return getattr(importlib.import_module(module), name)
+
+
+class Stats():
+    """the measures of one run, a hook is called as `hook(metric, value, tags)` for every measure, e.g.
+    `hook('query.seconds', 0.12, {'db': 'mydb', 'query': 'columns'})`"""
+
+    def __init__(self, tags=None, hooks=None):
+        self.tags = tags or {}
+        self.hooks = list(hooks or [])
+        self.lock = threading.Lock()  # queries are run by many threads with --jobs
+        self.start = time.perf_counter()
+        self.queries = OrderedDict()
+        self.phases = OrderedDict()
+        self.output_bytes = 0
+
+    def _emit(self, metric, value, **tags):
+        for hook in self.hooks:
+            hook(metric, value, dict(self.tags, **tags))
+
+    def add_query(self, name, seconds, rows):
+        with self.lock:
+            query = self.queries.setdefault(name, {'calls': 0, 'seconds': 0.0, 'rows': 0})
+            query['calls'] += 1
+            query['seconds'] += seconds
+            query['rows'] += rows
+        self._emit('query.seconds', seconds, query=name)
+        self._emit('query.rows', rows, query=name)
+
+    def add_phase(self, name, seconds):
+        with self.lock:
+            phase = self.phases.setdefault(name, {'calls': 0, 'seconds': 0.0})
+            phase['calls'] += 1
+            phase['seconds'] += seconds
+        self._emit('phase.seconds', seconds, phase=name)
+
+    def add_output(self, size):
+        with self.lock:
+            self.output_bytes += size
+        self._emit('output.bytes', size)
+
+    def timed(self, phase, chunks):
+        """pass the chunks of a generator through, the time until the last one is added to `phase`, which
+        includes the time the consumer spends on them"""
+        start = time.perf_counter()
+        for chunk in chunks:
+            yield chunk
+        self.add_phase(phase, time.perf_counter() - start)
+
+    def report(self):
+        report = OrderedDict([
+            ('tags', self.tags),
+            ('seconds', time.perf_counter() - self.start),
+            ('queries', self.queries),
+            ('phases', self.phases),
+            ('output_bytes', self.output_bytes),
+            ('peak_rss_bytes', peak_rss()),
+        ])
+        self._emit('run.seconds', report['seconds'])
+        if report['peak_rss_bytes'] is not None:
+            self._emit('run.peak_rss_bytes', report['peak_rss_bytes'])
+        return report
@@ -1,19 +1,259 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-import psycopg2
 import traceback
 import argparse
+import gc
 import sys
+import os
+import json
+import hashlib
 import logging
+import math
 import re
+import select
+import tempfile
+import time
 from collections import OrderedDict
-from jinja2 import Template
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import groupby
+from queue import Queue
+from stats import Stats, load_hook
+from model import Column, FkEdges, Table, ViewColumn, intern
+from renderers import RENDERERS, get_renderer
 
-from constants import SQL_TABLES, SQL_PK_UK, SQL_FK, SQL_CHECKS, SQL_COLUMNS, SQL_INHERIT, HTML_TEMPLATE, DOT_TEMPLATE
+from constants import SQL_RELATIONS, SQL_SIGNATURES, SQL_COLLAPSED_CHILDREN, SQL_COLLAPSED, SQL_FOCUS, SQL_HEAT, \
+    SQL_TABLES, SQL_PK_UK, SQL_FK, SQL_CHECKS, SQL_COLUMNS, SQL_COLUMNS_INFORMATION_SCHEMA, SQL_INHERIT, \
+    SQL_FK_COLUMNS, SQL_INDEXES, SQL_EXTRACT, SQL_EXTRACT_PART, \
+    HTML_TEMPLATE, DOT_TEMPLATE, \
+    HTML_STYLE_TEMPLATE, HTML_TABLES_TEMPLATE, HTML_MENU_SCRIPT_TEMPLATE, HTML_SHARD_INDEX_TEMPLATE, \
+    HTML_HEAT_TEMPLATE, HTML_HEAT_SCRIPT_TEMPLATE, \
+    FLEET_INDEX_TEMPLATE, SPLIT_INDEX_TEMPLATE, SERVE_INDEX_TEMPLATE
 
 default_logging_level = logging.WARNING
 
+# catalog queries in collect order, each one is handled by `PGUML._process_<name>`
+CATALOG_QUERIES = OrderedDict([
+    ('tables', SQL_TABLES),
+    ('columns', SQL_COLUMNS),
+    ('pk_uk', SQL_PK_UK),
+    ('fk', SQL_FK),
+    ('checks', SQL_CHECKS),
+    ('inherits', SQL_INHERIT),
+])
+
+# the oid columns of the catalog queries: name in the query and index in the row, a row is refreshed in the
+# cache when any of them is changed
+QUERY_OID_COLUMNS = {
+    'tables': (('oid', 0), ),
+    'columns': (('oid', 0), ),
+    'pk_uk': (('oid', 0), ),
+    'fk': (('oid', 0), ('ref_oid', 4)),
+    'checks': (('oid', 0), ),
+    'inherits': (('par_oid', 0), ('cll_oid', 3)),
+    'collapsed': (('oid', 0), ),
+    'heat': (('oid', 0), ),
+    'fk_columns': (('oid', 0), ('ref_oid', 3)),
+    'indexes': (('oid', 0), ),
+}
+
+# the order of the rows of a relation in the json extract, the same as the order by of the query, the rows of the
+# other queries have no order. the columns are ordered by their number, which the columns queries don't return
+EXTRACT_ORDER = {
+    'columns': '(select a.attnum from pg_catalog.pg_attribute a '
+               'where a.attrelid = s.oid and a.attname = s.column_name)',
+}
+
+# the rows of these queries change without any DDL, so they are fetched again by every refresh, and the model is
+# only built again if they are changed
+VOLATILE_QUERIES = ('heat', )
+
+CACHE_VERSION = 1
+
+OUTPUT_BUFFER_SIZE = 1 << 16
+
+# made by graphviz, see layout.py
+IMAGE_FORMATS = ('svg', 'png', 'pdf')
+
+LAYOUT_ENGINES = ('dot', 'neato', 'fdp', 'sfdp', 'twopi', 'circo')
+
+# the node colors of the heat overlay, from the coldest to the hottest
+HEAT_COLORS = ('#ffffcc', '#ffeda0', '#fed976', '#feb24c', '#fd8d3c', '#fc4e2a', '#e31a1c')
+
+SIZE_UNITS = ('bytes', 'kB', 'MB', 'GB', 'TB')
+
+# the parts of the queries which depend on the server version, placeholder -> (the lowest server_version_num, sql)
+# from the newest to the oldest, see `versioned_sql`
+VERSIONED_SQL = OrderedDict([
+    # pg_get_partkeydef and partitioned tables are new in PostgreSQL 10
+    ('partkey', ((100000, 'pg_catalog.pg_get_partkeydef(parent.oid)'), (0, 'null'))),
+    # the included columns are new in PostgreSQL 11, all the columns are keys before it
+    ('index_key_count', ((110000, 'i.indnkeyatts'), (0, 'i.indnatts'))),
+    # the parent constraint of a cloned fk is new in PostgreSQL 11, there is no clone before it
+    ('fk_parent', ((110000, 'pct.conparentid'), (0, '0'))),
+])
+
+# a "%(name)s" param, or an escaped "%%"
+PARAM_PATTERN = re.compile(r'%(?:\((\w+)\)s|%)')
+
+COLUMNS_QUERIES = {
+    'catalog': SQL_COLUMNS,
+    'information_schema': SQL_COLUMNS_INFORMATION_SCHEMA,
+}
+
+
+def pattern_to_regex(pattern, qualified=False):
+    """convert a glob pattern like `sales_*` to an anchored regex, a pattern starts with `~` is a regex already.
+    if `qualified`, the pattern is matched against `schema.table`, and a glob without schema matches any schema"""
+    if pattern.startswith('~'):
+        return pattern[1:]
+
+    if qualified and '.' not in pattern:
+        pattern = '*.' + pattern
+    regex = ''
+    for char in pattern:
+        if char == '*':
+            regex += '.*'
+        elif char == '?':
+            regex += '.'
+        elif char in '.^$+()[]{}|\\':
+            regex += '\\' + char
+        else:
+            regex += char
+    return '^{}$'.format(regex)
+
+
+def adjacency(edges, direction='both'):
+    """node -> its neighbors over the (from, to) edges, "out" follows the edges, "in" goes back and "both" does
+    both"""
+    neighbors = {}
+    for src, dst in edges:
+        if direction in ('out', 'both'):
+            neighbors.setdefault(src, set()).add(dst)
+        if direction in ('in', 'both'):
+            neighbors.setdefault(dst, set()).add(src)
+    return neighbors
+
+
+def neighborhood(roots, neighbors, depth):
+    """bfs from the roots over the `adjacency` of the edges, up to `depth` hops"""
+    seen = set(roots)
+    frontier = list(seen)
+    for _ in range(depth):
+        next_frontier = []
+        for node in frontier:
+            for neighbor in neighbors.get(node, ()):
+                if neighbor not in seen:
+                    seen.add(neighbor)
+                    next_frontier.append(neighbor)
+        if not next_frontier:
+            break
+        frontier = next_frontier
+    return seen
+
+
+def versioned_sql(server_version):
+    """placeholder -> the sql of `VERSIONED_SQL` for a server_version_num, e.g. 160002"""
+    return OrderedDict((name, next(sql for version, sql in variants if server_version >= version))
+                       for name, variants in VERSIONED_SQL.items())
+
+
+def to_prepared(sql):
+    """turn the "%(name)s" params of psycopg2 into "$1", "$2" ... of a prepared statement, a param used many times
+    is the same one, and "%%" into "%", return the sql and the param names in their order"""
+    names = []
+
+    def number(match):
+        if match.group(1) is None:
+            return '%'
+        if match.group(1) not in names:
+            names.append(match.group(1))
+        return '${}'.format(names.index(match.group(1)) + 1)
+
+    return PARAM_PATTERN.sub(number, sql), names
+
+
+def parse_size(value):
+    """"100MB" -> bytes, the units are the ones of pg_size_pretty, 1kB is 1024 bytes"""
+    match = re.match(r'^\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*$', value)
+    units = dict((unit.lower(), 1024 ** i) for i, unit in enumerate(SIZE_UNITS))
+    units.update({'': 1, 'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4})
+    if not match or match.group(2).lower() not in units:
+        raise argparse.ArgumentTypeError('invalid size: "{}", e.g. 100MB'.format(value))
+    return int(float(match.group(1)) * units[match.group(2).lower()])
+
+
+def pretty_size(size):
+    """bytes -> e.g. "12 MB", like pg_size_pretty"""
+    for unit in SIZE_UNITS[:-1]:
+        if size < 10240:
+            return '{} {}'.format(size, unit)
+        size = (size + 512) // 1024
+    return '{} {}'.format(size, SIZE_UNITS[-1])
+
+
+def heat_value(heat, metric):
+    """how hot a table is: its total size in bytes, or its scans and changed rows since the last stats reset"""
+    if metric == 'size':
+        return heat['bytes']
+    return heat['seq_scan'] + heat['idx_scan'] + heat['n_tup_ins'] + heat['n_tup_upd'] + heat['n_tup_del']
+
+
+@contextmanager
+def gc_paused():
+    """pause the cycle collector while the model or a view is made: the records are tracked by it, unlike the dicts
+    of plain values they replace, and every collection it runs on the way scans all of them again. nothing made
+    there is in a cycle, so it's all freed by the reference counts"""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def safe_filename(name):
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+@lru_cache(maxsize=None)
+def get_environment():
+    """the templates are compiled once per process, and the compiled bytecode is cached on disk for the next run.
+    jinja2 is imported here, so the formats which don't use it never load it"""
+    from jinja2 import Environment, DictLoader, FileSystemBytecodeCache
+    return Environment(
+        loader=DictLoader({
+            'dot': DOT_TEMPLATE,
+            'html': HTML_TEMPLATE,
+            'html_style': HTML_STYLE_TEMPLATE,
+            'html_tables': HTML_TABLES_TEMPLATE,
+            'html_menu_script': HTML_MENU_SCRIPT_TEMPLATE,
+            'html_heat': HTML_HEAT_TEMPLATE,
+            'html_heat_script': HTML_HEAT_SCRIPT_TEMPLATE,
+            'html_shard_index': HTML_SHARD_INDEX_TEMPLATE,
+            'fleet_index': FLEET_INDEX_TEMPLATE,
+            'split_index': SPLIT_INDEX_TEMPLATE,
+            'serve_index': SERVE_INDEX_TEMPLATE,
+        }),
+        bytecode_cache=FileSystemBytecodeCache(),
+        auto_reload=False,
+    )
+
+
+def make_view(tables, fks, inherits):
+    """the render model of the given tables, with only the edges between them"""
+    node_ids = set(table['node_id'] for table in tables)
+    return {
+        'tables': tables,
+        'menu': [(schema, list(schema_tables)) for schema, schema_tables in groupby(tables, lambda t: t['schema'])],
+        'fks': [fk for fk in fks if fk[0].split(':', 1)[0] in node_ids and fk[1].split(':', 1)[0] in node_ids],
+        'inherits': [ih for ih in inherits if ih[0] in node_ids and ih[1] in node_ids],
+        'heat': any(table.get('heat') for table in tables),
+    }
+
 
 class Logger():
     def __init__(self, name):
@@ -21,32 +261,45 @@ class Logger():
 
         self.logger = logging.getLogger(name or __name__)
         self.logger.setLevel(default_logging_level)
-        myhandler = logging.StreamHandler(stream=sys.stdout)
-        myhandler.setFormatter(logging.Formatter(logformat))
-        self.logger.addHandler(myhandler)
+        if not self.logger.handlers:  # loggers are shared, e.g. by the connections in a pool
+            myhandler = logging.StreamHandler(stream=sys.stdout)
+            myhandler.setFormatter(logging.Formatter(logformat))
+            self.logger.addHandler(myhandler)
 
 
 class DB():
-    def __init__(self, port, dbname, host, user, password):
+    def __init__(self, port, dbname, host, user, password, prepare=True):
         self.logger = Logger('DB').logger
         self.conn_str = "host='{}' dbname='{}' user='{}' port='{}' password='{}'".format(
             host, dbname, user, port, password)
+        self.prepare = prepare
         self.connect()
 
     def connect(self):
+        # imported here, so rendering a snapshot works without psycopg2
+        import psycopg2
         try:
             self.conn = psycopg2.connect(self.conn_str)
             self.conn.autocommit = True
+            self.prepared = {}  # sql -> (statement name, param names), they only live in the connection
         except Exception as err:
             errmsg = 'Connect to postgres "{}" failed: {}'.format(self.conn_str, err)
             self.logger.error(errmsg)
             raise err
 
-    def execute_sql(self, sql):
-        """execute sql and return"""
+    @property
+    def server_version(self):
+        """server_version_num, e.g. 160002, which psycopg2 reads when connected"""
+        return self.conn.server_version
+
+    def execute_sql(self, sql, params=None):
+        """execute sql and return, a sql is prepared on the server when it's first run, and the prepared statement
+        is run after, so it's only parsed once for a connection"""
         cur = self.conn.cursor()
         try:
-            cur.execute(sql)
+            if self.prepare:
+                sql, params = self._prepared(cur, sql, params)
+            cur.execute(sql, params)
             rows = cur.fetchall()
         except Exception as err:
             msg = "select failed: {}".format(traceback.format_exc())
@@ -55,78 +308,457 @@ class DB():
 
         return rows
 
+    def _prepared(self, cur, sql, params):
+        """prepare sql if it's not yet, return the execute statement and its params"""
+        if sql not in self.prepared:
+            prepared_sql, names = to_prepared(sql)
+            name = 'uml_pg_{}'.format(len(self.prepared) + 1)
+            cur.execute('prepare {} as {}'.format(name, prepared_sql))
+            self.prepared[sql] = (name, names)
+
+        name, names = self.prepared[sql]
+        if not names:
+            return 'execute {}'.format(name), None
+        return 'execute {}({})'.format(name, ', '.join(['%s'] * len(names))), [params[param] for param in names]
+
+    def fetch_batches(self, sql, params=None, batch_size=1000):
+        """execute sql with a server side cursor, and yield its rows `batch_size` at a time, a named cursor only
+        lives in a transaction, so one is started and rolled back after the last batch"""
+        self.conn.autocommit = False
+        cur = self.conn.cursor(name='uml_pg_batches')
+        try:
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        except Exception as err:
+            msg = "select failed: {}".format(traceback.format_exc())
+            self.logger.error(msg)
+            raise err
+        finally:
+            self.conn.rollback()
+            self.conn.autocommit = True
+
+    def export_snapshot(self):
+        """start a read only transaction and export its snapshot, so other connections can see the same data"""
+        self.conn.autocommit = False
+        self.conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        try:
+            cur = self.conn.cursor()
+            cur.execute('select pg_catalog.pg_export_snapshot()')
+            snapshot_id = cur.fetchone()[0]
+        except Exception:
+            self.end_transaction()
+            raise
+        return snapshot_id
+
+    def import_snapshot(self, snapshot_id):
+        """start a read only transaction which use the snapshot exported by another connection"""
+        self.conn.autocommit = False
+        self.conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+        cur = self.conn.cursor()
+        cur.execute('set transaction snapshot %s', (snapshot_id, ))
+
+    def end_transaction(self):
+        self.conn.rollback()
+        self.conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT')
+        self.conn.autocommit = True
+
+    def listen(self, channel):
+        cur = self.conn.cursor()
+        cur.execute('listen {}'.format(channel))
+
+    def wait_notifies(self, timeout):
+        """wait up to `timeout` seconds for notifications, return their payloads"""
+        if not self.conn.notifies:
+            select.select([self.conn], [], [], timeout)
+        self.conn.poll()
+        payloads = [notify.payload for notify in self.conn.notifies]
+        del self.conn.notifies[:]
+        return payloads
+
     def close(self):
         self.conn.close()
 
 
 class PGUML():
     def __init__(self, opts):
-        self.db = DB(dbname=opts.dbname, port=opts.port, host=opts.host, user=opts.user, password=opts.password)
+        self.logger = Logger('PGUML').logger
+        self.db_params = dict(dbname=opts.dbname, port=opts.port, host=opts.host, user=opts.user,
+                              password=opts.password, prepare=not opts.no_prepare)
+        self.db = None  # connected when the data is collected
         self.db_name = "{}_{}_{}".format(opts.host, opts.port, opts.dbname)
-        self.uml_tables = OrderedDict()
-        self.uml_fks = {}
-        self.uml_key_columns = {}
-        self.uml_related_tables = set()
-        self.uml_table_inherits = []
+        self._reset_model()
 
         self.only_key_columns = opts.only_key_columns
         self.only_related = opts.only_related
+        self.focus = opts.focus
+        self.focus_depth = opts.depth
+        self.focus_direction = opts.direction
         self.dot_rankdir = opts.dot_rankdir
         self.format = opts.format
+        self.output = opts.output
+        self.save_snapshot = opts.save_snapshot
+        self.from_snapshot = opts.from_snapshot
+        self.split = opts.split
+        self.output_dir = opts.output_dir
+        self.image_format = opts.image_format
+        self.render_jobs = opts.render_jobs
+        self.layout_engine = opts.layout_engine
+        self.html_shard = opts.html_shard
+        self.image_cache = opts.image_cache
         self.show_constraint = opts.show_constraint
+        self.jobs = max(1, min(opts.jobs, len(CATALOG_QUERIES)))
+        self.extract = opts.extract
+        self.batch_size = opts.batch_size
+        self.queries = OrderedDict(CATALOG_QUERIES)
+        self.queries['columns'] = COLUMNS_QUERIES[opts.columns_from]
+        self.collapse = opts.collapse_partitions or opts.collapse_threshold > 0
+        if self.collapse:
+            self.queries['collapsed'] = SQL_COLLAPSED
+        # --min-size and --top are filters on the heat, which is the size when not given
+        self.heat = opts.heat or ('size' if opts.min_size or opts.top else None)
+        self.min_size = opts.min_size
+        self.top = opts.top
+        if self.heat:
+            self.queries['heat'] = SQL_HEAT
+        self.index_report = opts.index_report
+        self.check_indexes = opts.check_indexes or bool(self.index_report)
+        if self.check_indexes:
+            self.queries['fk_columns'] = SQL_FK_COLUMNS
+            self.queries['indexes'] = SQL_INDEXES
+        self._build_filter(opts)
+
+        self.cache_dir = opts.cache_dir
+        self.stats_file = opts.stats
+        self.written = {}  # output file -> hash of the view it's rendered from, see `_up_to_date`
+        self.stats = Stats({'db': self.db_name}, [load_hook(hook) for hook in opts.stats_hook or []])
+        self.catalog_rows = None  # rows of the catalog queries, only kept when the cache is used
+        self.signatures = None
+
+    def _reset_model(self):
+        self.view = None
+        self.uml_tables = OrderedDict()
+        self.uml_fks = FkEdges(self.uml_tables)
+        self.uml_key_columns = {}
+        self.uml_related_tables = set()
+        self.uml_table_inherits = []
+        self.uml_fk_status = {}  # from port -> added/removed/changed, only used by diff
+        self.derived = {}  # the values computed from the whole model, see `_derived`
+
+    def _build_filter(self, opts):
+        """compile the schema and table patterns to the where conditions of the catalog queries"""
+        conditions = []
+        self.query_params = {}
+        for name, values, expr, operator, qualified in (
+                ('schemas', opts.schema, 'nspname', '~', False),
+                ('exclude_schemas', opts.exclude_schema, 'nspname', '!~', False),
+                ('tables', opts.table, "nspname || '.' || relname", '~', True),
+                ('exclude_tables', opts.exclude_table, "nspname || '.' || relname", '!~', True)):
+            if not values:
+                continue
+            self.query_params[name] = [pattern_to_regex(value, qualified) for value in values]
+            if operator == '~':
+                conditions.append('and {} ~ any(%({})s::text[])'.format(expr, name))
+            else:
+                conditions.append('and not {} ~ any(%({})s::text[])'.format(expr, name))
+
+        if self.focus:
+            self.query_params['focus'] = [pattern_to_regex(value, True) for value in self.focus]
+            self.query_params['focus_depth'] = self.focus_depth
+            self.query_params['focus_direction'] = self.focus_direction
+            conditions.append('and pg_class.oid in ({})'.format(SQL_FOCUS))
+
+        collapsed_children = SQL_COLLAPSED_CHILDREN
+        if self.collapse:
+            self.query_params['collapse_partitions'] = bool(opts.collapse_partitions)
+            # 0 means only the partitions, which is the same as a threshold nobody can reach
+            self.query_params['collapse_threshold'] = opts.collapse_threshold or sys.maxsize
+            conditions.append('and pg_class.oid not in ({})'.format(collapsed_children))
+
+        conditions = '\n        '.join(conditions)
+        relations = SQL_RELATIONS.format(conditions=conditions)
+        for name, sql in self.queries.items():
+            # the parts which depend on the server version are only known after connected, see
+            # `_use_server_version`
+            self.queries[name] = sql.format(conditions=conditions, relations=relations,
+                                            collapsed_children=collapsed_children,
+                                            **dict((part, '{' + part + '}') for part in VERSIONED_SQL))
+        self.signatures_sql = SQL_SIGNATURES.format(conditions=conditions)
+
+    def _use_server_version(self):
+        """fill the parts of the queries which depend on the server version, once for a connection"""
+        parts = versioned_sql(self.db.server_version)
+        self.logger.debug('Server version {}, use {}'.format(self.db.server_version, dict(parts)))
+        for name, sql in self.queries.items():
+            self.queries[name] = sql.format(**parts)
+
+    def _connect(self):
+        if self.db is None:
+            self.db = DB(**self.db_params)
+            self._use_server_version()
 
     def _collect_data(self):
-        self._process_tables()
-        self._process_columns()
-        self._process_pk_uk()
-        self._process_fk()
-        self._process_checks()
-        self._process_inherits()
-
-    def _process_tables(self):
-        rows = self.db.execute_sql(SQL_TABLES)
+        self._connect()
+
+        if self.cache_dir is None:
+            self._fetch_all()
+            return
+
+        self._load_cache()
+        self.refresh(save_cache=True)
+
+    def _fetch_all(self):
+        if self.extract == 'json':
+            self._fetch_json()
+            return
+
+        if self.jobs > 1:
+            self._collect_data_parallel()
+            return
+
+        for name, sql in self.queries.items():
+            self._process(name, self._execute(name, sql))
+
+    def _extract_sql(self):
+        """all the catalog queries in one, the rows of each query are grouped by their first oid column into a json
+        array, and the arrays of a table are put into one json document"""
+        parts, documents, joins = [], [], []
+        for name, sql in self.queries.items():
+            order = ' order by {}'.format(EXTRACT_ORDER[name]) if name in EXTRACT_ORDER else ''
+            parts.append(SQL_EXTRACT_PART.format(name=name, sql=sql, oid_column=QUERY_OID_COLUMNS[name][0][0],
+                                                 order=order))
+            documents.append("'{0}', q_{0}.rows".format(name))
+            if name != 'tables':
+                joins.append('left join q_{0} on (q_{0}.oid = q_tables.oid)'.format(name))
+        return SQL_EXTRACT.format(parts=','.join(parts), documents=', '.join(documents), joins='\n    '.join(joins))
+
+    def _fetch_json(self):
+        """fetch the catalog in one query with a server side cursor, --batch-size tables in each round trip.
+        the json documents are decoded by psycopg2, and their rows are turned back to the rows of the queries, so
+        they are processed and cached the same way"""
+        rows = OrderedDict((name, []) for name in self.queries)
+        start, count = time.perf_counter(), 0
+        for batch in self.db.fetch_batches(self._extract_sql(), self.query_params, self.batch_size):
+            count += len(batch)
+            for _, document in batch:
+                for name, query_rows in document.items():
+                    # an oid is a string in json
+                    oid_indexes = [idx for _, idx in QUERY_OID_COLUMNS[name]]
+                    for row in query_rows or []:
+                        row = list(row.values())
+                        for idx in oid_indexes:
+                            row[idx] = int(row[idx]) if row[idx] is not None else None
+                        rows[name].append(tuple(row))
+        self.stats.add_query('extract', time.perf_counter() - start, count)
+
+        # the documents are in no order, the tables are shown in the order of SQL_TABLES
+        rows['tables'].sort(key=lambda row: (row[1], row[2]))
+        for name, query_rows in rows.items():
+            self._process(name, query_rows)
+
+    def _execute(self, name, sql, params=None, db=None):
+        """run a query of the catalog, and count its time and rows in the stats"""
+        start = time.perf_counter()
+        rows = (db or self.db).execute_sql(sql, self.query_params if params is None else params)
+        self.stats.add_query(name, time.perf_counter() - start, len(rows))
+        return rows
+
+    def _collect_data_parallel(self):
+        """run the catalog queries on a pool of connections which share one exported snapshot,
+        rows are processed as soon as the query is finished, only tables must be processed first"""
+        try:
+            snapshot_id = self.db.export_snapshot()
+        except Exception as err:
+            self.logger.warning('Export snapshot failed, collect data with one connection: {}'.format(err))
+            self.jobs = 1
+            self._fetch_all()
+            return
+
+        pool = Queue()
+        pool.put(self.db)
+        workers = []
+        try:
+            for _ in range(self.jobs - 1):
+                worker = DB(**self.db_params)
+                workers.append(worker)
+                worker.import_snapshot(snapshot_id)
+                pool.put(worker)
+
+            with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+                futures = OrderedDict((executor.submit(self._fetch_from_pool, pool, name, sql), name)
+                                      for name, sql in self.queries.items())
+                tables_future = next(iter(futures))
+                self._process('tables', tables_future.result())
+                del futures[tables_future]
+                for future in as_completed(futures):
+                    self._process(futures[future], future.result())
+        finally:
+            for worker in workers:
+                worker.close()
+            self.db.end_transaction()
+
+    def _fetch_from_pool(self, pool, name, sql):
+        db = pool.get()
+        try:
+            return self._execute(name, sql, db=db)
+        finally:
+            pool.put(db)
+
+    def _process(self, name, rows):
+        self.logger.debug('Process {} rows of {}'.format(len(rows), name))
+        if self.catalog_rows is not None and self.catalog_rows[name] is not rows:
+            self.catalog_rows[name].extend(rows)
+        start = time.perf_counter()
+        with gc_paused():
+            getattr(self, '_process_{}'.format(name))(rows)
+        self.stats.add_phase('process_{}'.format(name), time.perf_counter() - start)
+
+    def refresh(self, save_cache=False):
+        """compare the relation signatures with the last ones, and only fetch the rows of the changed relations.
+        the signatures are read before the rows, so a change in between will be found by the next refresh.
+        if nothing is changed, only the rows of the volatile queries are fetched, and the model is only built again
+        if they are changed. the cache is saved if `save_cache` and the catalog is changed.
+        return the number of the changed relations, 0 if nothing is changed"""
+        changed = self._refresh_catalog()
+        if changed:
+            if save_cache:
+                self._save_cache()
+            return changed
+        return self._refresh_volatile()
+
+    def _refresh_catalog(self):
+        """fetch the changed relations, return the number of the changed and removed ones, all of them the first time"""
+        signatures = dict(self._execute('signatures', self.signatures_sql))
+        if self.catalog_rows is None:
+            self.catalog_rows = dict((name, []) for name in self.queries)
+            self._reset_model()
+            self._fetch_all()
+            self.signatures = signatures
+            return len(signatures)
+
+        changed = set(oid for oid, signature in signatures.items() if self.signatures.get(oid) != signature)
+        removed = set(self.signatures) - set(signatures)
+        self.logger.debug('Changed relations: {}, removed relations: {}'.format(len(changed), len(removed)))
+        if not changed and not removed:
+            return 0
+
+        stale = changed | removed
+        params = dict(self.query_params, changed=list(changed))
+        for name, sql in self.queries.items():
+            if name in VOLATILE_QUERIES:
+                self.catalog_rows[name] = self._execute(name, sql)
+                continue
+            oid_columns = QUERY_OID_COLUMNS[name]
+            rows = [row for row in self.catalog_rows[name] if not any(row[idx] in stale for _, idx in oid_columns)]
+            if changed:
+                sql = 'select * from ({}) as q where {}'.format(
+                    sql, ' or '.join('q.{} = any(%(changed)s::oid[])'.format(col) for col, _ in oid_columns))
+                rows.extend(self._execute('{}_changed'.format(name), sql, params))
+            self.catalog_rows[name] = rows
+        self.catalog_rows['tables'].sort(key=lambda row: (row[1], row[2]))
+
+        self._rebuild_model()
+        self.signatures = signatures
+        return len(stale)
+
+    def _refresh_volatile(self):
+        """fetch the rows of the volatile queries again, e.g. the heat, return the number of the relations whose
+        rows are changed"""
+        changed = set()
+        for name, sql in self.queries.items():
+            if name not in VOLATILE_QUERIES:
+                continue
+            rows = self._execute(name, sql)
+            stale = set(rows).symmetric_difference(self.catalog_rows[name])
+            if stale:
+                self.catalog_rows[name] = rows
+                changed.update(row[idx] for row in stale for _, idx in QUERY_OID_COLUMNS[name])
+        if changed:
+            self._rebuild_model()
+        return len(changed)
+
+    def _rebuild_model(self):
+        """build the model from the cached rows again"""
+        self._reset_model()
+        for name in self.queries:
+            self._process(name, self.catalog_rows[name])
+
+    def _cache_file(self):
+        filename = safe_filename(self.db_name) + '.json'
+        return os.path.join(self.cache_dir, filename)
+
+    def _cache_fingerprint(self):
+        """the cache is only valid for the same queries and filters"""
+        content = json.dumps([CACHE_VERSION, self.queries, self.query_params], sort_keys=True)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def _load_cache(self):
+        try:
+            with open(self._cache_file()) as f:
+                cache = json.load(f)
+        except (IOError, ValueError) as err:
+            self.logger.debug('Load cache failed: {}'.format(err))
+            return
+
+        if cache.get('fingerprint') != self._cache_fingerprint():
+            self.logger.debug('Cache is outdated, ignore it')
+            return
+
+        self.signatures = dict((int(oid), signature) for oid, signature in cache['signatures'].items())
+        self.catalog_rows = dict((name, [tuple(row) for row in rows]) for name, rows in cache['rows'].items())
+        self._rebuild_model()
+
+    def _save_cache(self):
+        if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        cache_file = self._cache_file()
+        with open(cache_file + '.tmp', 'w') as f:
+            json.dump({
+                'fingerprint': self._cache_fingerprint(),
+                'signatures': self.signatures,
+                'rows': self.catalog_rows,
+            }, f)
+        os.replace(cache_file + '.tmp', cache_file)
+
+    def _process_tables(self, rows):
         for row in rows:
             oid, schema, tablename, tabledesc, reltype = row
             self.uml_key_columns[oid] = set()
-            self.uml_tables[oid] = {
-                'schema': schema,
-                'tablename': tablename,
-                'outputname': "{}.{}".format(schema, tablename) if schema != 'public' else tablename,
-                'tabledesc': tabledesc if tabledesc is not None else '',
-                'reltype': reltype,
-                'columns': [],
-                'checks': [],
-                'pk': '',
-                'uk': []
-            }
+            self.uml_tables[oid] = Table(
+                schema=intern(schema),
+                tablename=tablename,
+                outputname="{}.{}".format(schema, tablename) if schema != 'public' else tablename,
+                tabledesc=tabledesc if tabledesc is not None else '',
+                reltype=intern(reltype),
+                columns=[],
+                checks=[],
+                pk='',
+                uk=[],
+            )
 
-    def _process_columns(self):
-        rows = self.db.execute_sql(SQL_COLUMNS)
+    def _process_columns(self, rows):
+        # the rows of a table come together, so its columns list is only looked up once
+        last_oid, columns = None, None
         for row in rows:
             oid, schema, _, colname, coldesc, coltype, is_nullable, coldefault = row
-            if oid not in self.uml_tables:
+            if oid != last_oid:
+                last_oid = oid
+                columns = self.uml_tables[oid].columns if oid in self.uml_tables else None
+            if columns is None:
                 continue
-            columns = self.uml_tables[oid]['columns']
-            columns.append({
-                'colname': colname,
-                'coldesc': coldesc if coldesc is not None else '',
-                'coltype': coltype,
-                'is_nullable': is_nullable,
-                'coldefault': coldefault
-            })
+            columns.append(Column(sys.intern(colname), coldesc if coldesc is not None else '', sys.intern(coltype),
+                                  is_nullable, coldefault))
 
-    def _process_pk_uk(self):
-        rows = self.db.execute_sql(SQL_PK_UK)
-        pattern = r'.*ON (.*) USING.*\((.*)\)'
+    def _process_pk_uk(self, rows):
         for row in rows:
-            oid, cons_name, cons_def, cons_type = row
+            oid, cons_name, cons_columns, cons_type = row
             if oid not in self.uml_tables:
                 continue
-            match = re.match(pattern, cons_def)
-            if not match:
-                raise "Can't pase index define: {}".format(cons_def)
 
-            columns = match.group(2)
+            columns = ', '.join(cons_columns)
             if cons_type == 'PK':
                 self.uml_tables[oid]['pk'] = columns  # one pk in one table
             else:
@@ -135,30 +767,25 @@ class PGUML():
                     'columns': columns
                 })
 
-            for col in columns.split(', '):
-                self.uml_key_columns[oid].add(col)
+            self.uml_key_columns[oid].update(cons_columns)
 
-    def _process_fk(self):
-        rows = self.db.execute_sql(SQL_FK)
+    def _process_fk(self, rows):
         for row in rows:
             from_oid, _, from_col_name, to_col_name, to_oid = row
-            if from_oid not in self.uml_tables:
+            if from_oid not in self.uml_tables or to_oid not in self.uml_tables:
                 continue
 
-            from_table_col = "{}:{}".format(self.uml_tables[from_oid]['outputname'].replace('.', '_'), from_col_name)
-            to_table_col = "{}:{}".format(self.uml_tables[to_oid]['outputname'].replace('.', '_'), to_col_name)
-
-            self.uml_fks[from_table_col] = to_table_col
+            from_col_name, to_col_name = intern(from_col_name), intern(to_col_name)
+            self.uml_fks.add(from_oid, from_col_name, to_oid, to_col_name)
             self.uml_key_columns[from_oid].add(from_col_name)
             self.uml_key_columns[to_oid].add(to_col_name)
             self.uml_related_tables.add(from_oid)
             self.uml_related_tables.add(to_oid)
 
-    def _process_inherits(self):
-        rows = self.db.execute_sql(SQL_INHERIT)
+    def _process_inherits(self, rows):
         for row in rows:
             par_oid, par_schema, par_table, chl_oid, chl_schema, chl_table = row
-            if par_oid not in self.uml_tables:
+            if par_oid not in self.uml_tables or chl_oid not in self.uml_tables:
                 continue
             self.uml_table_inherits.append({
                 'par_oid': par_oid,
@@ -174,8 +801,61 @@ class PGUML():
             self.uml_related_tables.add(par_oid)
             self.uml_related_tables.add(chl_oid)
 
-    def _process_checks(self):
-        rows = self.db.execute_sql(SQL_CHECKS)
+    def _process_collapsed(self, rows):
+        for row in rows:
+            oid, children, partkey = row
+            if oid not in self.uml_tables:
+                continue
+            self.uml_tables[oid]['collapsed'] = {
+                'children': children,
+                'partkey': partkey,
+            }
+            self.uml_related_tables.add(oid)
+
+    def _process_heat(self, rows):
+        for row in rows:
+            oid, reltuples, relpages, total_bytes, seq_scan, idx_scan, n_tup_ins, n_tup_upd, n_tup_del = row
+            if oid not in self.uml_tables:
+                continue
+            self.uml_tables[oid]['heat'] = {
+                'rows': reltuples,
+                'pages': relpages,
+                'bytes': total_bytes,
+                'seq_scan': seq_scan,
+                'idx_scan': idx_scan,
+                'n_tup_ins': n_tup_ins,
+                'n_tup_upd': n_tup_upd,
+                'n_tup_del': n_tup_del,
+            }
+
+    def _process_fk_columns(self, rows):
+        for row in rows:
+            oid, cons_name, columns, ref_oid = row
+            if oid not in self.uml_tables:
+                continue
+            self.uml_tables[oid].setdefault('fk_columns', []).append({
+                'cons_name': cons_name,
+                'columns': columns,
+                'ref_oid': ref_oid,
+            })
+
+    def _process_indexes(self, rows):
+        for row in rows:
+            oid, index_name, columns, method, is_unique, is_primary, expressions, predicate, index_bytes = row
+            if oid not in self.uml_tables:
+                continue
+            self.uml_tables[oid].setdefault('indexes', []).append({
+                'index_name': index_name,
+                'columns': columns,
+                'method': method,
+                'is_unique': is_unique,
+                'is_primary': is_primary,
+                'expressions': expressions,
+                'predicate': predicate,
+                'index_bytes': index_bytes,
+            })
+
+    def _process_checks(self, rows):
         for row in rows:
             oid, cons_name, consrc = row
             if oid not in self.uml_tables:
@@ -186,69 +866,444 @@ class PGUML():
                 'cons_src': consrc
             })
 
+    def _derived(self, name, make):
+        """a value computed from the whole model, e.g. the index warnings, which is made once and kept until the
+        model is changed, so the views of the serve mode only do the work of their own tables"""
+        if name not in self.derived:
+            self.derived[name] = make()
+        return self.derived[name]
+
+    def _visible_tables(self):
+        """the oids of the tables shown by --only-related, --focus, --min-size and --top, None for all of them"""
+        related_tables = self.uml_related_tables if self.only_related else None
+        if self.focus:
+            focus_tables = self._focus_tables(self.focus, self.focus_depth, self.focus_direction)
+            related_tables = focus_tables if related_tables is None else related_tables & focus_tables
+        if self.min_size or self.top:
+            heavy_tables = self._heavy_tables()
+            related_tables = heavy_tables if related_tables is None else related_tables & heavy_tables
+        return related_tables
+
+    def _index_check(self):
+        """the report and the warnings of `indexes.check_indexes`"""
+        from indexes import check_indexes
+        return self._derived('index_check', lambda: check_indexes(self.uml_tables))
+
+    def _heat_range(self):
+        values = [heat_value(table['heat'], self.heat) for table in self.uml_tables.values() if table.get('heat')]
+        return (min(values), max(values)) if values else None
+
+    @gc_paused()
+    def _build_view(self, oids=None):
+        """build the model the templates render: only the visible tables and columns, with the node ids, port ids,
+        pk/not null flags and fk targets computed here, so the templates just loop over it.
+        `oids` limits it to these tables, e.g. for the serve mode"""
+        related_tables = self._derived('visible_tables', self._visible_tables)
+        view_oids = self.uml_tables
+        if oids is not None:
+            related_tables = set(oids) if related_tables is None else related_tables & set(oids)
+            # only the tables of the view are looked at, in the order of the model
+            order = self._derived('table_order', lambda: dict((oid, idx) for idx, oid in enumerate(self.uml_tables)))
+            view_oids = sorted((oid for oid in related_tables if oid in order), key=order.get)
+        index_warnings = self._index_check()[1] if self.check_indexes else {}
+        heat_range = self._derived('heat_range', self._heat_range)
+        tables, fks = [], []
+        for oid in view_oids:
+            if related_tables is not None and oid not in related_tables:
+                continue
+
+            table = self.uml_tables[oid]
+            node_id = table['outputname'].replace('.', '_')
+            key_columns = self.uml_key_columns.get(oid, set()) if self.only_key_columns else None
+            pk, fk_targets = table['pk'], self.uml_fks.targets(oid)
+            fks.extend(("{}:{}".format(node_id, colname), to_port) for colname, to_port in fk_targets.items())
+            columns = []
+            for column in table['columns']:
+                colname = column.colname
+                if key_columns is not None and colname not in key_columns:
+                    continue
+                flag = '#' if colname == pk else ('*' if not column.is_nullable else '')
+                columns.append(ViewColumn(column, node_id, flag, fk_targets.get(colname)))
+
+            checks = []
+            if self.show_constraint:
+                for check in table['checks']:
+                    checks.append({
+                        'cons_name': check['cons_name'],
+                        'cons_src': check['cons_src'],
+                        'dot_src': check['cons_src'].replace('>', '&gt;').replace('<', '&lt;'),
+                    })
+
+            # a quoted partition key like range ("createdAt") would end the quoted label of dot
+            collapsed = self._collapsed_label(table)
+            tables.append({
+                'oid': oid,
+                'node_id': node_id,
+                'schema': table['schema'],
+                'tablename': table['tablename'],
+                'outputname': table['outputname'],
+                'columns': columns,
+                'uk': sorted(table['uk'], key=lambda uk: uk['cons_name']),
+                'checks': sorted(checks, key=lambda check: check['cons_name']),
+                'status': table.get('status'),
+                'collapsed': collapsed,
+                'dot_collapsed': collapsed and collapsed.replace('\\', '\\\\').replace('"', '\\"'),
+                'heat': self._heat_view(table, heat_range),
+                'index_warnings': index_warnings.get(oid, []),
+            })
+
+        # sorted, so the same catalog always makes the same output, whatever order the rows come in
+        fks = [(from_port, to_port, self.uml_fk_status.get(from_port)) for from_port, to_port in sorted(fks)]
+        inherits = self._derived('inherits', lambda: sorted(
+            (ih['par_outputname'].replace('.', '_'), ih['chl_outputname'].replace('.', '_'), ih.get('status'))
+            for ih in self.uml_table_inherits))
+        return make_view(tables, fks, inherits)
+
+    def _graph(self, inherits=True, direction='both'):
+        """node id -> oid of the tables, and node id -> its neighbors over the fks and the inherits"""
+        def make():
+            node_oids = dict((table['outputname'].replace('.', '_'), oid) for oid, table in self.uml_tables.items())
+            edges = [(from_port.split(':', 1)[0], to_port.split(':', 1)[0])
+                     for from_port, to_port in self.uml_fks.items()]
+            if inherits:
+                edges.extend((ih['chl_outputname'].replace('.', '_'), ih['par_outputname'].replace('.', '_'))
+                             for ih in self.uml_table_inherits)
+            return node_oids, adjacency(edges, direction)
+
+        return self._derived(('graph', inherits, direction), make)
+
+    def _focus_tables(self, focus, depth, direction):
+        """the oids of the tables within `depth` hops of the tables match the `focus` patterns, the catalog is
+        already cut down to them by the server, this is also needed when the model comes from a cache or a snapshot"""
+        node_oids, neighbors = self._graph(direction=direction)
+        patterns = [re.compile(pattern_to_regex(value, True)) for value in focus]
+        names = self._derived('qualified_names', lambda: [
+            (table['outputname'].replace('.', '_'), '{}.{}'.format(table['schema'], table['tablename']))
+            for table in self.uml_tables.values()])
+        roots = set()
+        for pattern in patterns:
+            roots.update(node for node, name in names if pattern.search(name))
+        nodes = neighborhood(roots, neighbors, depth)
+        return set(node_oids[node] for node in nodes if node in node_oids)
+
+    def _heavy_tables(self):
+        """the oids of the tables at least --min-size big and among the --top hottest ones, with their fk neighbors"""
+        heavy = sorted(((heat_value(table['heat'], self.heat), oid) for oid, table in self.uml_tables.items()
+                        if table.get('heat') and table['heat']['bytes'] >= (self.min_size or 0)), reverse=True)
+        if self.top:
+            heavy = heavy[:self.top]
+        node_oids, neighbors = self._graph(inherits=False)
+        roots = [self.uml_tables[oid]['outputname'].replace('.', '_') for _, oid in heavy]
+        return set(node_oids[node] for node in neighborhood(roots, neighbors, 1) if node in node_oids)
+
+    def _heat_view(self, table, heat_range):
+        """the color and font size level of a table on a log scale from the coldest to the hottest table, and a
+        label like "1,204,000 rows, 312 MB, 5,120 scans, 80 writes" for it"""
+        heat = table.get('heat')
+        if not heat:
+            return None
+
+        coldest, hottest = [math.log1p(value) for value in heat_range]
+        level = 0
+        if hottest > coldest:
+            scale = (math.log1p(heat_value(heat, self.heat)) - coldest) / (hottest - coldest)
+            level = int(round(scale * (len(HEAT_COLORS) - 1)))
+        return dict(heat, level=level, color=HEAT_COLORS[level], size=pretty_size(heat['bytes']),
+                    label='{:,} rows, {}, {:,} scans, {:,} writes'.format(
+                        heat['rows'], pretty_size(heat['bytes']), heat['seq_scan'] + heat['idx_scan'],
+                        heat['n_tup_ins'] + heat['n_tup_upd'] + heat['n_tup_del']))
+
+    def _collapsed_label(self, table):
+        """e.g. "orders (3,124 partitions, range on created_at)" for a table with collapsed children"""
+        collapsed = table.get('collapsed')
+        if not collapsed:
+            return None
+
+        if table['reltype'] != 'partitioned table':
+            return '{} ({:,} children)'.format(table['outputname'], collapsed['children'])
+
+        label = '{} ({:,} partitions'.format(table['outputname'], collapsed['children'])
+        match = re.match(r'^(\w+) \((.*)\)$', collapsed['partkey'] or '')
+        if match:
+            label += ', {} on {}'.format(match.group(1).lower(), match.group(2))
+        return label + ')'
+
+    def _render(self, name, view=None):
+        """return a generator which yields the output of the format `name` piece by piece"""
+        if view is None:
+            if self.view is None:
+                start = time.perf_counter()
+                self.view = self._build_view()
+                self.stats.add_phase('build_view', time.perf_counter() - start)
+            view = self.view
+        return self.stats.timed('render_{}'.format(name), get_renderer(name)(self, view))
+
     def _as_dot(self):
-        template = Template(DOT_TEMPLATE)
-        dot = template.render(
-            tables=self.uml_tables,
-            fks=self.uml_fks,
-            key_columns=self.uml_key_columns if self.only_key_columns else set(),
-            related_tables=self.uml_related_tables if self.only_related else None,
-            rankdir=self.dot_rankdir,
-            show_constraint=self.show_constraint,
-            table_inherits=self.uml_table_inherits
-        )
-        return dot
+        return self._render('dot')
 
     def _as_html(self):
-        template = Template(HTML_TEMPLATE)
-        html = template.render(
-            db_name=self.db_name,
-            tables=self.uml_tables,
-            fks=self.uml_fks,
-            key_columns=self.uml_key_columns if self.only_key_columns else set(),
-            related_tables=self.uml_related_tables if self.only_related else None,
-            rankdir=self.dot_rankdir,
-            show_constraint=self.show_constraint,
-            table_inherits=self.uml_table_inherits
-        )
-        return html
+        return self._render('html')
 
     def _out_digraph(self):
-        if self.format == 'dot':
-            output = self._as_dot()
+        if self.split:
+            from split import SplitOutput
+            SplitOutput(self).go()
+            return
+
+        if self.format == 'html' and self.html_shard:
+            from shard import ShardedHtmlOutput
+            ShardedHtmlOutput(self).go()
+            return
+
+        if self.format in IMAGE_FORMATS:
+            self._out_image()
+            return
+
+        self._write_output(self._render(self.format), self.output)
+
+    def _out_image(self):
+        """write the dot to a temp file and hash it on the way, then lay it out, or use the cached image"""
+        from layout import hash_chunks, render_image
+        digest = hashlib.sha256()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dot_file = os.path.join(tmp_dir, 'uml.dot')
+            self._write_output(hash_chunks(self._as_dot(), digest), dot_file)
+            start = time.perf_counter()
+            render_image(dot_file, self.output, self.format, self.layout_engine, self.image_cache, digest)
+            self.stats.add_phase('layout', time.perf_counter() - start)
+            if self.output != '-':
+                self.stats.add_output(os.path.getsize(self.output))
+
+    def _up_to_date(self, output, view):
+        """True if `output` is already rendered from the same view, so a long running process (watch mode) only
+        writes the files which are changed, otherwise remember the view of the file which is going to be written"""
+        digest = hashlib.sha1(json.dumps(view, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        if self.written.get(output) == digest and os.path.exists(output):
+            return True
+        self.written[output] = digest
+        return False
+
+    def _write_output(self, chunks, output):
+        """write the chunks as they are rendered, the whole output is never kept in memory"""
+        if output == '-':
+            self._write_chunks(chunks, sys.stdout)
         else:
-            output = self._as_html()
+            with open(output, 'w', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE) as out:
+                self._write_chunks(chunks, out)
 
-        print(output)
+    def _write_chunks(self, chunks, out):
+        size = 1
+        for chunk in chunks:
+            out.write(chunk)
+            size += len(chunk.encode('utf-8'))
+        out.write('\n')
+        out.flush()
+        self.stats.add_output(size)
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
 
     def go(self):
-        self._collect_data()
+        if self.from_snapshot:
+            from snapshot import load_snapshot
+            load_snapshot(self, self.from_snapshot)
+        else:
+            self._collect_data()
+        if self.save_snapshot:
+            from snapshot import save_snapshot
+            save_snapshot(self, self.save_snapshot)
         self._out_digraph()
+        if self.index_report:
+            self._write_index_report()
+        if self.stats_file:
+            self._write_stats()
 
+    def dump(self):
+        """collect the data and only save it to --output as a snapshot"""
+        from snapshot import save_snapshot
+        try:
+            self._collect_data()
+        finally:
+            self.close()
+        save_snapshot(self, self.output)
+        if self.stats_file:
+            self._write_stats()
 
-def main():
+    def _write_index_report(self):
+        report = json.dumps(self._index_check()[0], indent=2)
+        if self.index_report == '-':
+            sys.stderr.write(report + '\n')
+        else:
+            with open(self.index_report, 'w') as f:
+                f.write(report + '\n')
+
+    def _write_stats(self):
+        report = json.dumps(self.stats.report(), indent=2)
+        if self.stats_file == '-':
+            sys.stderr.write(report + '\n')
+        else:
+            with open(self.stats_file, 'w') as f:
+                f.write(report + '\n')
+
+
+def get_parser():
+    """the command line options, also used to make the options of the benchmarks"""
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('command', help='"render" one database, "dump" the catalog of one database to a snapshot '
+                        'file, "watch" one database and render again when its DDL changes, "serve" the diagrams of '
+                        'one database over http, "fleet" to render all the databases in the --inventory file, or '
+                        '"diff" to compare --old with --new', nargs='?', default='render',
+                        choices=['render', 'dump', 'watch', 'serve', 'fleet', 'diff'])
     parser.add_argument('--host', help='Database hostname', type=str, default='127.0.0.1')
     parser.add_argument('--port', help='Database port', type=str, default='5432')
     parser.add_argument('--dbname', help='Database name', type=str, default='postgres')
     parser.add_argument('--user', help='Database user', type=str, default='user')
     parser.add_argument('--password', help='Database passowrd', type=str, default='')
+    parser.add_argument('--schema', help='Only show the schemas match this pattern, a glob like "sales_*" or a '
+                        'regex starts with "~", can be given more than once', type=str, action='append')
+    parser.add_argument('--exclude-schema', help='Do not show the schemas match this pattern', type=str,
+                        action='append')
+    parser.add_argument('--table', help='Only show the tables match this pattern, "schema.table" or "table" which '
+                        'matches any schema, a regex is matched against "schema.table"', type=str, action='append')
+    parser.add_argument('--exclude-table', help='Do not show the tables match this pattern', type=str,
+                        action='append')
     parser.add_argument('--only-key-columns', help='Only show fk and pk columns for table', action="store_true")
     parser.add_argument('--only-related', help='Only show related tables', action="store_true")
+    parser.add_argument('--focus', help='Only show the tables within --depth fk or inherit hops of the tables match '
+                        'this pattern, "schema.table" or "table", can be given more than once', type=str,
+                        action='append')
+    parser.add_argument('--depth', help='Focus mode: how many hops from the focus tables', type=int, default=1)
+    parser.add_argument('--direction', help='Focus mode: follow the fks to the tables they reference ("out"), '
+                        'from the tables reference them ("in"), or both', type=str, default='both',
+                        choices=['in', 'out', 'both'])
     parser.add_argument('--show-constraint', help='Show constraint', action="store_true")
+    parser.add_argument('--collapse-partitions', help='Show the partitions of a partitioned table as one summary '
+                        'node, the partitions are not fetched', action="store_true")
+    parser.add_argument('--collapse-threshold', help='Show the children of a parent which has at least this many '
+                        'children as one summary node, 0 means never, children with their own columns are still '
+                        'shown', type=int, default=0)
+    parser.add_argument('--heat', help='Color and size the tables by their total size ("size") or by their scans and '
+                        'changed rows ("workload"), from pg_class and pg_stat_user_tables', type=str,
+                        choices=['size', 'workload'])
+    parser.add_argument('--min-size', help='Heat: only show the tables at least this big, e.g. 100MB, and their fk '
+                        'neighbors', type=parse_size)
+    parser.add_argument('--top', help='Heat: only show the N hottest tables and their fk neighbors', type=int)
+    parser.add_argument('--check-indexes', help='Show the fks which no index covers, and the indexes which are the '
+                        'same as or a leading part of another index, in the tables', action="store_true")
+    parser.add_argument('--index-report', help='Index check: also write all the unindexed fks and the duplicate '
+                        'and redundant indexes to this json file, "-" is stderr', type=str)
     parser.add_argument('--dot-rankdir', help='Rank direction for dot output', type=str,
                         default='LR', choices=["TB", "LR", "BT", "RL"])
-    parser.add_argument('--format', help='Output format', type=str, default='dot', choices=['dot', 'html'])
+    parser.add_argument('--format', help='Output format, svg/png/pdf are made by graphviz', type=str, default='dot',
+                        choices=list(RENDERERS) + list(IMAGE_FORMATS))
+    parser.add_argument('--layout-engine', help='Graphviz layout engine for svg/png/pdf', type=str, default='dot',
+                        choices=LAYOUT_ENGINES)
+    parser.add_argument('--image-cache', help='Keep the svg/png/pdf images in this directory by the hash of the dot, '
+                        'graphviz is skipped if the dot is not changed', type=str)
+    parser.add_argument('--columns-from', help='Where to read the columns from, pg_attribute based catalog '
+                        'query or information_schema.columns', type=str, default='catalog',
+                        choices=sorted(COLUMNS_QUERIES))
+    parser.add_argument('--output', help='Write the output to this file, "-" is stdout', type=str, default='-')
+    parser.add_argument('--save-snapshot', help='Also save the collected data to this file, which can be used '
+                        'by diff and --from-snapshot, gzip\'d if it ends with ".gz"', type=str)
+    parser.add_argument('--from-snapshot', help='Render the snapshot saved by "dump" or --save-snapshot, without '
+                        'connecting to the database', type=str)
+    parser.add_argument('--jobs', help='Number of connections used to collect data in parallel', type=int, default=1)
+    parser.add_argument('--extract', help='Fetch the catalog with one query for each part ("queries"), or with one '
+                        'query which returns a json document for each table, in batches ("json"), which is much '
+                        'faster for a far away database, --jobs is not used then', type=str, default='queries',
+                        choices=['queries', 'json'])
+    parser.add_argument('--batch-size', help='Json extract: number of tables fetched in each round trip', type=int,
+                        default=1000)
+    parser.add_argument('--no-prepare', help='Send the catalog queries as text every time, instead of as prepared '
+                        'statements, e.g. behind pgbouncer in transaction pooling mode', action="store_true")
+    parser.add_argument('--cache-dir', help='Cache the catalog in this directory, the next run only fetch the '
+                        'changed tables', type=str)
+    parser.add_argument('--inventory', help='Fleet mode: a json/yaml file of the targets, or a file with one '
+                        '"host:port/dbname" per line, "host:port/*" means all the databases of the cluster', type=str)
+    parser.add_argument('--split', help='Write one file for each connected component of the tables or for each '
+                        'schema to --output-dir, with an index page', type=str, choices=['component', 'schema'])
+    parser.add_argument('--image-format', help='Split mode: also run graphviz dot for each part to make images',
+                        type=str, choices=IMAGE_FORMATS)
+    parser.add_argument('--render-jobs', help='Split mode: number of graphviz dot processes run in parallel',
+                        type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--html-shard', help='Html format: write one small file for each schema ("schema") or for '
+                        'each N tables to --output-dir, with an index.html which loads them when they are opened',
+                        type=str)
+    parser.add_argument('--output-dir', help='Fleet, split and html shard mode: write the outputs and index here',
+                        type=str, default='.')
+    parser.add_argument('--fleet-jobs', help='Fleet mode: number of databases rendered in parallel', type=int,
+                        default=8)
+    parser.add_argument('--cluster-jobs', help='Fleet mode: number of databases of one cluster rendered in parallel',
+                        type=int, default=2)
+    parser.add_argument('--install-trigger', help='Watch mode: install an event trigger which notifies the DDL '
+                        'changes, needs a super user', action='store_true')
+    parser.add_argument('--watch-interval', help='Watch mode: also check for changes every this many seconds, '
+                        'serve mode: check for changes every this many seconds', type=float, default=60)
+    parser.add_argument('--debounce', help='Watch mode: wait until there is no DDL for this many seconds, e.g. '
+                        'during a migration', type=float, default=2)
+    parser.add_argument('--bind', help='Serve mode: listen on this address', type=str, default='127.0.0.1')
+    parser.add_argument('--http-port', help='Serve mode: listen on this port', type=int, default=8000)
+    parser.add_argument('--serve-cache-size', help='Serve mode: number of rendered outputs kept in memory',
+                        type=int, default=128)
+    parser.add_argument('--old', help='Diff mode: a snapshot file or "host:port/dbname" to compare from', type=str)
+    parser.add_argument('--new', help='Diff mode: a snapshot file or "host:port/dbname" to compare to', type=str)
+    parser.add_argument('--diff-report', help='Diff mode: write all the changes to this json file', type=str)
+    parser.add_argument('--stats', help='Write the time and rows of every catalog query, the time of every phase, '
+                        'the output size and the peak memory to this json file, "-" is stderr', type=str)
+    parser.add_argument('--stats-hook', help='Also pass every measure to this function, "module:function", which is '
+                        'called as function(metric, value, tags), can be given more than once', type=str,
+                        action='append')
     parser.add_argument('--verbose', help='Output more info', action="store_true")
+    return parser
+
 
+def main():
+    parser = get_parser()
     opts = parser.parse_args()
     if opts.verbose:
         global default_logging_level
         default_logging_level = logging.DEBUG
 
+    if opts.html_shard:
+        from shard import parse_html_shard
+        try:
+            parse_html_shard(opts.html_shard)
+        except ValueError as err:
+            parser.error(str(err))
+
+    if opts.command == 'fleet':
+        if not opts.inventory:
+            parser.error('fleet mode needs --inventory')
+        from fleet import Fleet
+        sys.exit(0 if Fleet(opts).go() else 1)
+
+    if opts.command == 'diff':
+        if not opts.old or not opts.new:
+            parser.error('diff mode needs --old and --new')
+        from diff import SchemaDiff, load_side
+        schema_diff = SchemaDiff(load_side(opts.old, opts), load_side(opts.new, opts))
+        if opts.diff_report:
+            with open(opts.diff_report, 'w') as f:
+                json.dump(schema_diff.report, f, indent=2)
+        schema_diff.merged(opts)._out_digraph()
+        sys.exit(1 if schema_diff.has_changes() else 0)
+
     uml = PGUML(opts)
-    uml.go()
+    if opts.command == 'watch':
+        from watch import Watcher
+        Watcher(uml, opts.install_trigger, opts.watch_interval, opts.debounce).go()
+    elif opts.command == 'serve':
+        from serve import DiagramServer
+        DiagramServer(uml, opts.bind, opts.http_port, opts.watch_interval, opts.serve_cache_size).go()
+    elif opts.command == 'dump':
+        uml.dump()
+    else:
+        uml.go()
 
 
 if __name__ == '__main__':
+    sys.modules.setdefault('uml', sys.modules[__name__])  # the other modules import this one as `uml`
     main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Keep the outputs up to date: wait for the DDL notifications sent by an event trigger, refresh only the changed
+relations of the model, and rewrite only the output files which are changed."""
+
+import time
+
+from uml import Logger
+
+CHANNEL = 'uml_pg_ddl'
+
+# sends the oid of every relation touched by a DDL command to CHANNEL, and an empty payload for the other objects,
+# e.g. types, so any DDL wakes up the watchers. Event triggers can only be created by a super user.
+SQL_INSTALL_TRIGGER = '''
+    create or replace function public.uml_pg_notify_ddl() returns event_trigger language plpgsql as $$
+    declare
+        r record;
+    begin
+        if tg_event = 'sql_drop' then
+            for r in select classid, objid from pg_catalog.pg_event_trigger_dropped_objects() loop
+                perform pg_catalog.pg_notify('{channel}',
+                    case when r.classid = 'pg_catalog.pg_class'::regclass then r.objid::text else '' end);
+            end loop;
+        else
+            for r in select classid, objid from pg_catalog.pg_event_trigger_ddl_commands() loop
+                perform pg_catalog.pg_notify('{channel}',
+                    case when r.classid = 'pg_catalog.pg_class'::regclass then r.objid::text else '' end);
+            end loop;
+        end if;
+    end
+    $$;
+    drop event trigger if exists uml_pg_ddl_command_end;
+    create event trigger uml_pg_ddl_command_end on ddl_command_end execute procedure public.uml_pg_notify_ddl();
+    drop event trigger if exists uml_pg_sql_drop;
+    create event trigger uml_pg_sql_drop on sql_drop execute procedure public.uml_pg_notify_ddl();
+'''.format(channel=CHANNEL)
+
+
+class Watcher():
+    def __init__(self, uml, install_trigger=False, interval=60.0, debounce=2.0, max_delay=30.0):
+        self.logger = Logger('Watcher').logger
+        self.uml = uml
+        self.install_trigger = install_trigger
+        self.interval = interval  # check the signatures this often even if nothing is notified
+        self.debounce = debounce  # wait until the notifications stop for this long, e.g. during a migration
+        self.max_delay = max_delay  # but never longer than this after the first one
+
+    def _install_trigger(self):
+        cur = self.uml.db.conn.cursor()
+        try:
+            cur.execute(SQL_INSTALL_TRIGGER)
+        except Exception as err:
+            self.logger.warning('Install the event trigger failed, only check for changes every {}s: {}'.format(
+                self.interval, err))
+
+    def _wait(self):
+        """wait for a burst of notifications to end, or for the interval. the relations are found changed by their
+        signatures, so the payloads are not needed"""
+        if not self.uml.db.wait_notifies(self.interval):
+            return
+        deadline = time.time() + self.max_delay
+        while time.time() < deadline:
+            if not self.uml.db.wait_notifies(min(self.debounce, deadline - time.time())):
+                break
+
+    def _update(self):
+        """refresh the model, and rewrite the outputs if anything is changed, return the number of the changed
+        relations"""
+        changed = self.uml.refresh(save_cache=self.uml.cache_dir is not None)
+        if changed:
+            self.uml._out_digraph()
+        return changed
+
+    def go(self):
+        uml = self.uml
+        uml._connect()
+        if self.install_trigger:
+            self._install_trigger()
+        uml.db.listen(CHANNEL)
+        if uml.cache_dir is not None:
+            uml._load_cache()
+        uml.refresh(save_cache=uml.cache_dir is not None)
+        uml._out_digraph()
+        self.logger.info('Watch {} tables of {}'.format(len(uml.uml_tables), uml.db_name))
+
+        try:
+            while True:
+                self._wait()
+                start = time.time()
+                changed = self._update()
+                if changed:
+                    self.logger.info('Changed {} relations, outputs updated in {:.2f}s'.format(
+                        changed, time.time() - start))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            uml.close()